@@ -244,6 +244,11 @@ Based on advanced analysis and available technical resources, here's a detailed
 def health_check():
     return jsonify({"status": "ok", "time": time.time()})
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Mock responses need no models, so this is ready as soon as it answers
+    return jsonify({"service": "app", "ready": True, "state": "ready", "timings": {}})
+
 @app.route('/process', methods=['POST'])
 def process_audio():
     if 'file' not in request.files:
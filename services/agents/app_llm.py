@@ -1,16 +1,188 @@
-from flask import Flask, request, jsonify
-import os
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
 import time
-from dialogue import process_dialogue
+import dialogue
+from dialogue import format_search_results, process_dialogue, process_speech_stream, search_pdfs, transcribe
+from chat_logs import DatabaseBusy, DatabaseError, DatabaseUnavailable
+from jobs import JobQueue, QueueFull
+from postdialogue import postprocess_service_report, service_report
+from readiness import Readiness, serving_process
 
 app_llm = Flask(__name__)
+readiness = Readiness("app_llm")
+
+def make_report(data):
+    # Service report for a finished job from its session's logged turns (session_id), and/or
+    # transcripts and chat log rows sent along, with a confidence per field and the fields
+    # that need the technician's review
+    return postprocess_service_report(
+        {**service_report, **data.get("report", {})},
+        transcripts=data.get("transcripts", []),
+        chat_log=data.get("chat_log", []),
+        ticket=data.get("ticket"),
+        session_id=data.get("session_id"),
+    )
+
+# Background jobs: the same work as /process and /report, queued in SQLite and run by
+# JOBS_WORKERS threads once the models are loaded
+jobs = JobQueue.from_env({
+    "process": lambda params, audio: {"response": process_dialogue(audio, scope=params.get("scope"))},
+    "report": lambda params, _: make_report(params),
+})
+
+def startup(readiness):
+    # Heavy imports and model loading happen here, after /health is already reachable
+    with readiness.phase("import"):
+        import langchain_chroma, langchain_huggingface  # noqa: F401
+    with readiness.phase("load_embeddings"):
+        dialogue.get_embeddings()
+    if dialogue.reranker is not None:
+        with readiness.phase("load_reranker"):
+            dialogue.reranker.load()
+    with readiness.phase("warmup"):
+        dialogue.warmup()
+    jobs.start()
+
+if serving_process():
+    readiness.start(startup)
 
 @app_llm.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "time": time.time()})
 
+@app_llm.route('/ready', methods=['GET'])
+def ready():
+    report, status = readiness.report()
+    return jsonify(report), status
+
+def not_ready():
+    return jsonify({"error": "Models are still loading"}), 503, {"Retry-After": "5"}
+
+def search_scope(values):
+    # Optional ticket scope from form fields or a JSON body: manual and equipment (comma
+    # separated or lists) and an inclusive page_from / page_to range
+    scope = {}
+    for key in ("manual", "equipment"):
+        value = values.get(key)
+        if isinstance(value, str):
+            value = [part.strip() for part in value.split(",") if part.strip()]
+        if value:
+            scope[key] = value
+    first, last = values.get("page_from"), values.get("page_to")
+    if first not in (None, "") or last not in (None, ""):
+        try:
+            scope["pages"] = (int(first) if first not in (None, "") else None,
+                              int(last) if last not in (None, "") else None)
+        except (TypeError, ValueError):
+            raise ValueError("page_from and page_to must be integers")
+    return scope
+
+@app_llm.route('/search', methods=['POST'])
+def search():
+    if not readiness.ready:
+        return not_ready()
+    data = request.get_json() or {}
+    query = data.get("query", "")
+    if not query:
+        return jsonify({"error": "query is required"}), 400
+    try:
+        scope = search_scope(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        k = int(data.get("k", 3))
+    except (TypeError, ValueError):
+        k = 0
+    if not 1 <= k <= 50:
+        return jsonify({"error": "k must be an integer from 1 to 50"}), 400
+    results = search_pdfs(query, k=k, **scope)
+    return jsonify({"results": [
+        {**source, "content": content}
+        for source, (content, _, _) in zip(format_search_results(results), results)
+    ]})
+
+@app_llm.route('/search/stats', methods=['GET'])
+def search_stats():
+    # Re-ranking cache hits, pairs scored and fallbacks to retrieval order on the latency budget
+    return jsonify({"rerank": dialogue.reranker.stats() if dialogue.reranker is not None else None})
+
+@app_llm.route('/report', methods=['POST'])
+def report():
+    try:
+        return jsonify(make_report(request.get_json() or {}))
+    except DatabaseBusy as e:
+        return jsonify({"error": f"Chat log database busy: {e}"}), 503, {"Retry-After": "1"}
+    except DatabaseUnavailable as e:
+        return jsonify({"error": f"Chat log database unavailable: {e}"}), 503, {"Retry-After": "5"}
+    except DatabaseError as e:
+        return jsonify({"error": f"Chat log query failed: {e}"}), 502
+
+def job_accepted(kind, params, payload=None):
+    try:
+        job_id = jobs.submit(kind, params, payload)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    status_url = f"/jobs/{job_id}"
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+
+@app_llm.route('/jobs/process', methods=['POST'])
+def submit_process_job():
+    # Same form as /process, answered at once with a job id; jobs submitted while the models
+    # load wait in the queue
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '' or not file.filename.endswith('.wav'):
+        return jsonify({"error": "Invalid file format"}), 400
+    try:
+        scope = search_scope(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return job_accepted("process", {"scope": scope}, file.read())
+
+@app_llm.route('/jobs/report', methods=['POST'])
+def submit_report_job():
+    return job_accepted("report", request.get_json() or {})
+
+@app_llm.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    # Job status, position in the queue while queued, and the result or error once finished.
+    # ?wait=N long-polls up to N seconds (at most 60) for the job to finish.
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    job = jobs.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({"error": "No such job"}), 404
+    return jsonify(job)
+
+@app_llm.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Streams a JSON line per status change until the job finishes, the last one with its result
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "No such job"}), 404
+
+    def generate(job):
+        yield json.dumps(job) + "\n"
+        while job["status"] not in ("done", "failed"):
+            status = job["status"]
+            job = jobs.get(job_id, wait=15, seen_status=status)
+            if job is None:
+                return
+            if job["status"] != status:
+                yield json.dumps(job) + "\n"
+            else:
+                yield "\n"  # keeps proxies from closing an idle stream
+
+    return Response(stream_with_context(generate(job)), mimetype='application/x-ndjson')
+
+@app_llm.route('/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(jobs.stats())
+
 @app_llm.route('/process', methods=['POST'])
 def process_audio():
+    if not readiness.ready:
+        return not_ready()
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
@@ -18,24 +190,24 @@ def process_audio():
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
 
+    try:
+        scope = search_scope(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     if file and file.filename.endswith('.wav'):
-        # Save temporarily
-        filepath = os.path.join('/tmp', file.filename)
-        file.save(filepath)
+        # Keep the upload in memory, it is forwarded as-is to the transcription service
+        audio = file.read()
 
-        response = process_dialogue(filepath)
+        response = process_dialogue(audio, scope=scope)
 
         # Just return file info for now
         file_info = {
             "filename": file.filename,
-            "size_bytes": os.path.getsize(filepath),
-            "save_path": filepath,
+            "size_bytes": len(audio),
             "received_at": time.time()
         }
 
-        # Clean up
-        os.remove(filepath)
-
         return jsonify({
             "status": "success",
             "response": response,
@@ -45,5 +217,31 @@ def process_audio():
 
     return jsonify({"error": "Invalid file format"}), 400
 
+@app_llm.route('/process/stream', methods=['POST'])
+def process_audio_stream():
+    # Streams JSON lines: the transcript, the matching manual pages, then plan tokens
+    # as they are generated, ending with the full plan
+    if not readiness.ready:
+        return not_ready()
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+
+    file = request.files['file']
+    if file.filename == '' or not file.filename.endswith('.wav'):
+        return jsonify({"error": "Invalid file format"}), 400
+
+    try:
+        scope = search_scope(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    text = transcribe(file.read())
+
+    def generate():
+        yield json.dumps({"transcript": text}) + "\n"
+        for message in process_speech_stream(text, scope=scope):
+            yield json.dumps(message) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 if __name__ == '__main__':
     app_llm.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Same settings as the API's AIChatLogService
+DB_SETTINGS = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "port": int(os.environ.get("DB_PORT", 5432)),
+    "dbname": os.environ.get("DB_NAME", "postgres"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD", "postgres"),
+}
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+# How long a request waits for a pooled connection when all DB_POOL_SIZE are in use
+DB_POOL_TIMEOUT_S = float(os.environ.get("DB_POOL_TIMEOUT_S", 10))
+# Rows per keyset page; a few hundred turns come back in one or two round trips
+CHAT_LOG_PAGE_SIZE = int(os.environ.get("CHAT_LOG_PAGE_SIZE", 500))
+CHAT_CONTEXT_CACHE_SIZE = int(os.environ.get("CHAT_CONTEXT_CACHE_SIZE", 256))
+
+TURN_COLUMNS = "id, ticket_id, message_type, user_message, ai_response, voice_transcription, session_id, created_at"
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn() raises at once when the pool is empty, so callers queue here
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+class DatabaseUnavailable(Exception):
+    # The database could not be reached
+    pass
+
+class DatabaseError(Exception):
+    # The database was reached but a query failed
+    pass
+
+class DatabaseBusy(Exception):
+    # Every pooled connection stayed in use for DB_POOL_TIMEOUT_S
+    pass
+
+def get_pool():
+    # psycopg2 is imported and the pool opened on first use, so the service starts without a database
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+
+                _pool = ThreadedConnectionPool(1, DB_POOL_SIZE, **DB_SETTINGS)
+    return _pool
+
+@contextmanager
+def connection():
+    # psycopg2 errors come out as DatabaseUnavailable (connecting, or the connection dropped)
+    # or DatabaseError (the query itself); DatabaseBusy when no connection frees up in time
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT_S):
+        raise DatabaseBusy(f"all {DB_POOL_SIZE} database connections in use")
+    try:
+        try:
+            import psycopg2
+            pool = get_pool()
+            conn = pool.getconn()
+        except ImportError as e:
+            raise DatabaseUnavailable(f"psycopg2 is not installed: {e}") from e
+        except Exception as e:
+            raise DatabaseUnavailable(str(e).strip()) from e
+        try:
+            yield conn
+        except psycopg2.OperationalError as e:
+            raise DatabaseUnavailable(str(e).strip()) from e
+        except psycopg2.Error as e:
+            raise DatabaseError(str(e).strip()) from e
+        finally:
+            if conn.closed:
+                pool.putconn(conn, close=True)
+            else:
+                conn.rollback()  # end the read transaction before the connection goes back
+                pool.putconn(conn)
+    finally:
+        _pool_slots.release()
+
+def iter_session_turns(session_id, after_id=0, page_size=None):
+    # Yields a session's ai_chat_logs rows as dicts, oldest first. Pages are keyset paginated on
+    # id (WHERE id > last seen id), so each page is one index range scan on (session_id, id)
+    # however deep into the session it starts. The connection is only held while a page is
+    # fetched, not while the caller works through it.
+    page_size = page_size or CHAT_LOG_PAGE_SIZE
+    while True:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {TURN_COLUMNS} FROM ai_chat_logs "
+                "WHERE session_id = %s AND id > %s ORDER BY id LIMIT %s",
+                (session_id, after_id, page_size)
+            )
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        for row in rows:
+            yield dict(zip(columns, row))
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1][0]
+
+def get_session_ticket(session_id):
+    # Ticket fields the service report takes as given, for the ticket a session belongs to
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT t.ticket_number, t.location, te.employee_id AS technician_employee_id "
+            "FROM ai_chat_logs l JOIN tickets t ON t.id = l.ticket_id "
+            "LEFT JOIN technicians te ON te.id = t.assigned_technician_id "
+            "WHERE l.session_id = %s AND l.ticket_id IS NOT NULL ORDER BY l.id LIMIT 1",
+            (session_id,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+def get_session_started_at(session_id):
+    # When the session's first turn was logged, taken as the time of service
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT MIN(created_at) FROM ai_chat_logs WHERE session_id = %s", (session_id,))
+        return cursor.fetchone()[0]
+
+def format_turn(row):
+    # Conversation lines for one ai_chat_logs row
+    lines = [f"Technician: {row.get('voice_transcription') or row.get('user_message')}"]
+    if row.get("ai_response"):
+        lines.append(f"Assistant: {row['ai_response']}")
+    return lines
+
+class SessionContextCache:
+    # Formatted conversation lines per session, LRU over max_sessions. Logs only grow, so a
+    # cached session is brought up to date by fetching the turns after the last id it has seen.
+
+    def __init__(self, max_sessions=256):
+        self.max_sessions = max_sessions
+        self.entries = OrderedDict()  # session_id -> (last_id, lines)
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "rows_fetched": 0}
+
+    def lines(self, session_id):
+        with self.lock:
+            last_id, lines = self.entries.get(session_id, (0, []))
+            self.counts["hits" if last_id else "misses"] += 1
+        lines = list(lines)
+        fetched = 0
+        for row in iter_session_turns(session_id, after_id=last_id):
+            lines.extend(format_turn(row))
+            last_id = row["id"]
+            fetched += 1
+        with self.lock:
+            self.counts["rows_fetched"] += fetched
+            current = self.entries.get(session_id)
+            if current is None or current[0] <= last_id:
+                self.entries[session_id] = (last_id, lines)
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_sessions:
+                self.entries.popitem(last=False)
+        return lines
+
+    def invalidate(self, session_id):
+        with self.lock:
+            self.entries.pop(session_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"sessions": len(self.entries), **self.counts}
+
+session_contexts = SessionContextCache(CHAT_CONTEXT_CACHE_SIZE)
@@ -0,0 +1,52 @@
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+def service_url(name, default_port):
+    host = os.environ.get(f"{name.upper()}_SERVICE_HOST", f"{name}_service")
+    port = os.environ.get(f"{name.upper()}_SERVICE_PORT", default_port)
+    return f"http://{host}:{port}"
+
+class ServiceClient:
+    # Keep-alive connection pool to one of the model services, with per-call timeouts and
+    # retries on connection errors and overload (429/502/503/504, honouring Retry-After).
+    # In both cases the service did no work, so POSTs are safe to repeat. A read timeout or a
+    # dropped response is not retried: the request may still be running there, and sending it
+    # again would stack another full generation on an already overloaded service.
+
+    def __init__(self, base_url, timeout=(3, 60), retries=2, pool_size=16):
+        self.base_url = base_url
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path, timeout=None, **kwargs):
+        response = self.session.post(self.base_url + path, timeout=timeout or self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, path, timeout=None, **kwargs):
+        # POST to an endpoint answering with JSON lines and yield each message as it arrives
+        response = self.session.post(self.base_url + path, timeout=timeout or self.timeout, stream=True, **kwargs)
+        response.raise_for_status()
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+transcribe_client = ServiceClient(service_url("transcribe", 8001), timeout=(3, 120))
+planning_client = ServiceClient(service_url("planning", 8002), timeout=(3, 300))
+embedding_client = ServiceClient(service_url("embedding", 8000), timeout=(3, 30))
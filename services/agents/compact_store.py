@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+COMPACT_DIR = "compact"
+DTYPES = ("float16", "int8")
+BLOCK_ROWS = 1 << 16  # rows scored per block, bounds the temporary float32 copy
+
+def quantize(vectors, dtype):
+    # float16 halves each vector; int8 stores each vector scaled to [-127, 127] with its own
+    # float32 scale, a quarter of the float32 size
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def approximate_scores(codes, scales, query):
+    # Inner products of one normalized query with every quantized vector
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        block = codes[start:start + BLOCK_ROWS].astype(np.float32)
+        scores[start:start + len(block)] = block @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+def top_rows(scores, n):
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.array([], dtype=np.int64)
+    return np.argpartition(-scores, n - 1)[:n]
+
+def rerank(vectors, candidates, query, k):
+    # Exact float32 scores for the candidates, best k first
+    rows = np.sort(candidates)  # sequential reads from the memory map
+    exact = vectors[rows] @ query
+    order = np.argsort(-exact)[:k]
+    return rows[order], exact[order]
+
+def build_compact_store(vector_store, save_path, dtype="int8", page_size=2048):
+    # Exports the Chroma collection's embeddings as quantized codes (kept in memory when
+    # searching) plus the float32 vectors (memory mapped, only top candidates are read back
+    # for the exact re-rank), with chunk texts and metadata in SQLite. Built next to the live
+    # copy and swapped in, so readers never see a half written store.
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}")
+    path = os.path.join(save_path, COMPACT_DIR)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    db = sqlite3.connect(os.path.join(tmp, "chunks.sqlite3"))
+    db.execute("CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE, document TEXT, metadata TEXT)")
+    dim = count = 0
+    with open(os.path.join(tmp, "vectors.f32"), "wb") as full, \
+            open(os.path.join(tmp, f"codes.{dtype}"), "wb") as codes_file, \
+            open(os.path.join(tmp, "scales.f32"), "wb") as scales_file:
+        while True:
+            page = vector_store.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=count)
+            if not len(page["ids"]):
+                break
+            vectors = normalize(page["embeddings"])
+            dim = vectors.shape[1]
+            codes, scales = quantize(vectors, dtype)
+            full.write(vectors.tobytes())
+            codes_file.write(codes.tobytes())
+            if scales is not None:
+                scales_file.write(scales.tobytes())
+            db.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                [(count + i, doc_id, text, json.dumps(metadata or {}))
+                 for i, (doc_id, text, metadata) in enumerate(zip(page["ids"], page["documents"], page["metadatas"]))]
+            )
+            count += len(page["ids"])
+    db.commit()
+    db.close()
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"dtype": dtype, "dim": dim, "count": count}, f)
+
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return count
+
+def compact_dtype(save_path):
+    # dtype of the compact store in save_path, or None if it has none
+    try:
+        with open(os.path.join(save_path, COMPACT_DIR, "meta.json")) as f:
+            return json.load(f)["dtype"]
+    except FileNotFoundError:
+        return None
+
+def compact_version(save_path):
+    try:
+        return os.stat(os.path.join(save_path, COMPACT_DIR, "meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _matches(metadata, where):
+    # The subset of Chroma's where syntax build_filter produces: $and, $in, $gte, $lte, equality
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_matches(metadata, clause) for clause in where["$and"])
+    for key, condition in where.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, target in condition.items():
+            if op == "$eq" and value != target:
+                return False
+            if op == "$in" and value not in target:
+                return False
+            if op == "$gte" and (value is None or value < target):
+                return False
+            if op == "$lte" and (value is None or value > target):
+                return False
+    return True
+
+class CompactVectorStore:
+    # Read-only stand-in for the Chroma store over a compact export: the quantized codes are
+    # searched brute force and the best rerank_k candidates are re-scored exactly against the
+    # float32 vectors. Implements the parts of the Chroma interface the search path uses.
+
+    def __init__(self, save_path, embedding_function, rerank_k=32):
+        from langchain_core.documents import Document
+
+        self.Document = Document
+        self.path = os.path.join(save_path, COMPACT_DIR)
+        self.embedding_function = embedding_function
+        self.rerank_k = rerank_k
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        self.dtype, dim, count = meta["dtype"], meta["dim"], meta["count"]
+        shape = (count, dim)
+        # Codes and scales are read into memory; the float32 vectors stay on disk
+        self.codes = np.fromfile(os.path.join(self.path, f"codes.{self.dtype}"), dtype=self.dtype).reshape(shape)
+        self.scales = np.fromfile(os.path.join(self.path, "scales.f32"), dtype=np.float32) if self.dtype == "int8" else None
+        self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r", shape=shape) \
+            if count else np.zeros(shape, dtype=np.float32)
+        self.db = sqlite3.connect(os.path.join(self.path, "chunks.sqlite3"), check_same_thread=False)
+        self.metadatas = [json.loads(metadata) for (metadata,) in self.db.execute("SELECT metadata FROM chunks ORDER BY row")]
+        self.masks = OrderedDict()  # recent filters -> rows they allow; ticket scopes repeat
+
+    def nbytes(self):
+        # Resident size of the searchable index
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def search_vector(self, query, k=4, exact=True, where=None):
+        # Returns (rows, scores), best first
+        if not len(self.codes):
+            # An export of an empty collection has no dimension to score a query against
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        query = normalize(query)
+        scores = approximate_scores(self.codes, self.scales, query)
+        if where:
+            allowed = self._mask(where)
+            scores[~allowed] = -np.inf
+            k = min(k, int(allowed.sum()))
+        candidates = top_rows(scores, max(k, self.rerank_k) if exact else k)
+        candidates = candidates[np.isfinite(scores[candidates])]
+        if exact:
+            return rerank(self.vectors, candidates, query, k)
+        order = np.argsort(-scores[candidates])[:k]
+        return candidates[order], scores[candidates][order]
+
+    def _mask(self, where):
+        key = json.dumps(where, sort_keys=True)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = np.array([_matches(metadata, where) for metadata in self.metadatas], dtype=bool)
+            self.masks[key] = mask
+            while len(self.masks) > 64:
+                self.masks.popitem(last=False)
+        return mask
+
+    def similarity_search(self, query, k=4, filter=None):
+        rows, _ = self.search_vector(self.embedding_function.embed_query(query), k, where=filter)
+        return self._documents(rows.tolist())
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        marks = ",".join("?" * len(ids))
+        rows = self.db.execute(f"SELECT id, document, metadata FROM chunks WHERE id IN ({marks})", ids).fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows],
+            "metadatas": [json.loads(row[2]) for row in rows],
+        }
+
+    def _documents(self, rows):
+        if not rows:
+            return []
+        marks = ",".join("?" * len(rows))
+        found = {row: (doc_id, text, json.loads(metadata)) for row, doc_id, text, metadata in self.db.execute(
+            f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({marks})", rows
+        )}
+        return [self.Document(id=found[row][0], page_content=found[row][1], metadata=found[row][2]) for row in rows]
+
+def report(save_path, queries=200, k=10, rerank_k=32, seed=0):
+    # Recall@k of each compact format against exact float32 search, using stored chunk vectors
+    # as queries (each excluded from its own results), with resident memory and query latency
+    with open(os.path.join(save_path, COMPACT_DIR, "meta.json")) as f:
+        meta = json.load(f)
+    shape = (meta["count"], meta["dim"])
+    if not shape[0]:
+        return "empty store, nothing to report"
+    vectors = np.memmap(os.path.join(save_path, COMPACT_DIR, "vectors.f32"), dtype=np.float32, mode="r", shape=shape)
+    sample = np.random.default_rng(seed).choice(shape[0], size=min(queries, shape[0]), replace=False)
+
+    def exact_top(row):
+        scores = np.asarray(vectors @ vectors[row])
+        scores[row] = -np.inf
+        return set(top_rows(scores, k).tolist())
+
+    truth = {row: exact_top(row) for row in sample}
+    lines = [f"{shape[0]} vectors x {shape[1]} dims, recall@{k} over {len(sample)} queries",
+             f"{'format':<22}{'MB':>10}{'bytes/vec':>11}{'recall':>9}{'ms/query':>10}"]
+    lines.append(f"{'float32 (exact)':<22}{vectors.nbytes / 2**20:>10.1f}{4 * shape[1]:>11}{1.0:>9.3f}{'':>10}")
+    for dtype in DTYPES:
+        codes, scales = quantize(vectors, dtype)
+        size = codes.nbytes + (scales.nbytes if scales is not None else 0)
+        for with_rerank in (False, True):
+            hits, start = 0, time.perf_counter()
+            for row in sample:
+                query = np.asarray(vectors[row])
+                scores = approximate_scores(codes, scales, query)
+                scores[row] = -np.inf
+                if with_rerank:
+                    candidates, _ = rerank(vectors, top_rows(scores, max(k, rerank_k)), query, k)
+                else:
+                    candidates = top_rows(scores, k)
+                hits += len(truth[row] & set(candidates.tolist()))
+            elapsed = (time.perf_counter() - start) * 1000 / len(sample)
+            name = dtype + (f" + rerank {rerank_k}" if with_rerank else "")
+            lines.append(f"{name:<22}{size / 2**20:>10.1f}{size // shape[0]:>11}"
+                         f"{hits / (k * len(sample)):>9.3f}{elapsed:>10.2f}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate the compact vector store")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("save_path", nargs="?", default="data/vectorstore")
+    parser.add_argument("--dtype", choices=DTYPES, default="int8")
+    parser.add_argument("--queries", type=int, default=200, help="sample queries for the report")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank-k", type=int, default=32, help="candidates re-scored in float32")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from langchain_chroma import Chroma
+
+        start = time.time()
+        count = build_compact_store(Chroma(persist_directory=args.save_path), args.save_path, args.dtype)
+        print(f"[compact] {count} vectors written as {args.dtype} in {time.time() - start:.1f}s")
+    else:
+        print(report(args.save_path, args.queries, args.k, args.rerank_k))
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,95 @@
 import os
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+from clients import planning_client, transcribe_client
+from lexical import LexicalIndex
+from rerank import Reranker
+from vectorstore import build_filter, get_vector_store, hybrid_search
 
-embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-large-en-v1.5")
+EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+
+# "hybrid" fuses dense and BM25 rankings when the store has a lexical index, "dense" never does
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "hybrid")
+# "compact" searches the int8/float16 export of the store (see compact_store.py) when there is one
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+# Chunks retrieved for the cross-encoder to re-rank down to k (RERANK_MODEL="" turns it off)
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 20))
+# Where clients fetch the pages search results point at (see page_service)
+PAGE_SERVICE_PUBLIC_URL = os.environ.get("PAGE_SERVICE_PUBLIC_URL", "http://localhost:8003")
+SEARCH_DENSE_K = int(os.environ.get("SEARCH_DENSE_K", 6))
+SEARCH_LEXICAL_K = int(os.environ.get("SEARCH_LEXICAL_K", 6))
+SEARCH_DENSE_WEIGHT = float(os.environ.get("SEARCH_DENSE_WEIGHT", 1.0))
+SEARCH_LEXICAL_WEIGHT = float(os.environ.get("SEARCH_LEXICAL_WEIGHT", 1.0))
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    # Loaded on first use (app_llm does it on its startup thread) rather than at import, so
+    # importing this module stays cheap. With HF_HUB_OFFLINE=1 the weights come from the
+    # local Hugging Face cache baked into the image (see prefetch_models.py).
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+                _embeddings = CachedEmbeddings(
+                    HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
+                    EmbeddingCache.from_env(EMBEDDING_MODEL)
+                )
+    return _embeddings
+
+reranker = Reranker.from_env()
+
+# Runs independent stages of a dialogue turn concurrently
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get("DIALOGUE_WORKERS", 8)))
+
+def warmup(save_path="data/vectorstore"):
+    # Runs the embedding and re-ranking models once and opens the vector store, so the first
+    # turn pays for none of them
+    get_embeddings().embedder.embed_query("how do I reset the door controller")
+    if reranker is not None:
+        reranker.warmup()
+    if os.path.isdir(save_path):
+        get_vector_store(save_path, get_embeddings(), VECTOR_STORE)
 
 def process_image():
     pass
 
-def search_pdfs(query, save_path="data/vectorstore", k=3):
-    vector_store = Chroma(
-        persist_directory=save_path,
-        embedding_function=embeddings
-    )
-    results = vector_store.similarity_search(query, k=k)
+def search_pdfs(query, save_path="data/vectorstore", k=3, mode=SEARCH_MODE,
+                manual=None, equipment=None, pages=None):
+    # manual, equipment and pages scope the search to the ticket's equipment (see build_filter).
+    # A scope that matches nothing, e.g. equipment missing from the catalog, searches everything.
+    # With a reranker, RERANK_CANDIDATES chunks are retrieved and the best k of them kept. In
+    # hybrid mode the dense ranking stays at SEARCH_DENSE_K and BM25 fills the rest of the pool,
+    # so re-ranking does not grow the more expensive vector search.
+    n = max(k, RERANK_CANDIDATES) if reranker is not None else k
+    dense_k = max(k, SEARCH_DENSE_K)
+    vector_store = get_vector_store(save_path, get_embeddings(), VECTOR_STORE)
+    if isinstance(equipment, str):
+        equipment = equipment.strip().lower()
+    elif equipment:
+        equipment = [value.strip().lower() for value in equipment]
+    if mode == "hybrid" and LexicalIndex.exists(save_path):
+        results = hybrid_search(
+            vector_store, save_path, query, k=n,
+            dense_k=dense_k, lexical_k=max(k, SEARCH_LEXICAL_K, n - dense_k),
+            dense_weight=SEARCH_DENSE_WEIGHT, lexical_weight=SEARCH_LEXICAL_WEIGHT,
+            manual=manual, equipment=equipment, pages=pages
+        )
+    else:
+        results = vector_store.similarity_search(query, k=n, filter=build_filter(manual, equipment, pages))
+    if not results and (manual or equipment or pages):
+        return search_pdfs(query, save_path, k, mode)
+    results = reranker.rerank(query, results, k) if reranker is not None else results[:k]
     return [(result.page_content, result.metadata["source"], result.metadata["page"])
             for result in results]
 
-def process_speech(user_input, mock=True):
+def process_speech(user_input, mock=True, scope=None):
     # Receive speech input from user
     # Ideally perform planning
 
@@ -27,43 +98,82 @@ def process_speech(user_input, mock=True):
     # payload = {"text": user_input}
     # response = requests.post(embedding_endpoint, json=payload).json()
     # embedding = response["embeddings"] # list
-    planning_endpoint = "http://planning_service:8002/plan"
 
-    output = search_pdfs(user_input)
-    search_results = []
-    for content, source, page in output:
-        search_results.append({"pdf": f"{os.path.basename(source)}", "page": f"{page}"})
+    # Search and planning are independent, run them side by side
+    search = executor.submit(search_pdfs, user_input, **(scope or {}))
+    planning = executor.submit(planning_client.post, "/plan", json=plan_request(user_input))
 
-    # TODO Perform planning, or maybe planning should be done at the beginning step?
-    plan = requests.post(planning_endpoint, json={"context": "you are a good emacs user", "instruction": "prepare a plan for someone to start emacs, via a good config file"}).json()["plan"]
+    output = search.result()
+    search_results = format_search_results(output)
+
+    plan = planning.result()["plan"]
 
     assert output is not None
     return plan
 
+def process_speech_stream(user_input, scope=None):
+    # Same stages as process_speech, but yields messages as they become available: the search
+    # results, then the plan as the planning service generates it. The plan request is opened
+    # alongside the search. A failure ends the stream with {"error": ..., "done": true}, so
+    # clients can tell it apart from a finished plan.
+    search = executor.submit(search_pdfs, user_input, **(scope or {}))
+    plan_stream = planning_client.stream("/plan", json={**plan_request(user_input), "stream": True})
+    first = executor.submit(next, plan_stream, None)
+    try:
+        yield {"sources": format_search_results(search.result())}
+    except Exception as e:
+        yield {"sources": [], "error": f"Search failed: {e}"}
+    try:
+        message = first.result()
+        while message is not None:
+            yield message
+            if message.get("done"):
+                return
+            message = next(plan_stream, None)
+        yield {"error": "Planning service ended the plan early", "done": True}
+    except Exception as e:
+        yield {"error": f"Planning failed: {e}", "done": True}
+
+def plan_request(user_input):
+    # TODO Perform planning, or maybe planning should be done at the beginning step?
+    return {"context": "you are a good emacs user", "instruction": "prepare a plan for someone to start emacs, via a good config file"}
+
+def format_search_results(output):
+    # Each result links to just its page, as a one-page PDF and a PNG thumbnail
+    results = []
+    for content, source, page in output:
+        url = f"{PAGE_SERVICE_PUBLIC_URL}/pages/{quote(os.path.basename(source))}/{page}"
+        results.append({"pdf": f"{os.path.basename(source)}", "page": f"{page}",
+                        "page_pdf": f"{url}.pdf", "page_png": f"{url}.png"})
+    return results
+
 def process_modality(user_input):
     # TODO Match on filetype
     pass
 
-def process_dialogue(user_input_filepath, mock=True):
-    # Receive input from user, which could be speech or image
+def transcribe(user_input):
+    return transcribe_client.post("/transcribe", files={"file": ("audio.wav", user_input)})["text"]
+
+def process_dialogue(user_input, mock=True, scope=None):
+    # Receive input from user, which could be speech or image, as raw file bytes.
+    # scope holds search_pdfs filters for the ticket, e.g. {"equipment": "mx20"}
     output = None
-    transcribe_endpoint = "http://transcribe_service:8001/transcribe"
 
-    while user_input_filepath:
+    while user_input:
         # Ensure modality = text or image
-        modality = "speech" if mock else process_modality(user_input_filepath) # Some function of the user input
+        modality = "speech" if mock else process_modality(user_input) # Some function of the user input
         match modality:
             case "image":
                 user_input_image = None
                 pass
             case "speech":
-                # TODO Currently limited to speech of 30s
-                user_input_speech = requests.post(transcribe_endpoint, files={"file": open(user_input_filepath, "rb")}).json()["text"]
-                output = process_speech(user_input_speech)
+                # Long dictations can use the transcribe service's /transcribe/stream instead
+                user_input_speech = transcribe(user_input)
+                output = process_speech(user_input_speech, scope=scope)
             case None:
                 pass
 
         # TODO Make proper dialogue loop
-        user_input_filepath = None
+        user_input = None
     assert output is not None
     return output
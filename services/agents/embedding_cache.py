@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+class EmbeddingCache:
+    # Two tier cache of text embeddings: in-memory LRU in front of an optional SQLite file.
+    # Keys hash the model name with the text, so switching models never returns stale vectors.
+
+    def __init__(self, model_name, max_entries=4096, path=None, max_disk_entries=100_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            # Vectors of any other model can never be hit again
+            self.db.execute("DELETE FROM embeddings WHERE model != ?", (model_name,))
+            self.db.commit()
+
+    @classmethod
+    def from_env(cls, model_name):
+        return cls(
+            model_name,
+            max_entries=int(os.environ.get("EMBED_CACHE_SIZE", 4096)),
+            path=os.environ.get("EMBED_CACHE_PATH") or None,
+            max_disk_entries=int(os.environ.get("EMBED_CACHE_DISK_SIZE", 100_000)),
+        )
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        key = self.key(text)
+        with self.lock:
+            emb = self.memory.get(key)
+            if emb is not None:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return emb
+            if self.db is not None:
+                row = self.db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self.db.commit()
+                    emb = array("f", row[0]).tolist()
+                    self._remember(key, emb)
+                    self.hits["disk"] += 1
+                    return emb
+            self.misses += 1
+            return None
+
+    def put(self, text, emb):
+        key = self.key(text)
+        emb = list(emb)
+        with self.lock:
+            self._remember(key, emb)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    (key, self.model_name, array("f", emb).tobytes(), time.time())
+                )
+                self._evict_disk()
+                self.db.commit()
+
+    def _remember(self, key, emb):
+        self.memory[key] = emb
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        count = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_disk_entries:
+            self.db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
+
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.hits.values()) + self.misses
+            return {
+                "model": self.model_name,
+                "memory_entries": len(self.memory),
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": sum(self.hits.values()) / lookups if lookups else 0.0,
+            }
+
+class CachedEmbeddings(Embeddings):
+    # Drop-in wrapper for a LangChain embedder that consults an EmbeddingCache first
+
+    def __init__(self, embedder, cache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def embed_query(self, text):
+        emb = self.cache.get(text)
+        if emb is None:
+            emb = self.embedder.embed_query(text)
+            self.cache.put(text, emb)
+        return emb
+
+    def embed_documents(self, texts):
+        embs = [self.cache.get(text) for text in texts]
+        missing = [i for i, emb in enumerate(embs) if emb is None]
+        if missing:
+            computed = self.embedder.embed_documents([texts[i] for i in missing])
+            for i, emb in zip(missing, computed):
+                self.cache.put(texts[i], emb)
+                embs[i] = emb
+        return embs
@@ -1,20 +1,124 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
 from flask import Flask, request, jsonify
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from readiness import Readiness
+
+MAX_BATCH_SIZE = int(os.environ.get("EMBED_MAX_BATCH_SIZE", 32))
+MAX_WAIT_MS = float(os.environ.get("EMBED_MAX_WAIT_MS", 10))
+EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+
 app = Flask(__name__)
-embedder = HuggingFaceEmbeddings(model_name="BAAI/bge-large-en-v1.5")
+readiness = Readiness("embedding_service")
+cache = EmbeddingCache.from_env(EMBEDDING_MODEL)
+embedder = cached_embedder = batcher = None  # set by startup()
+
+class MicroBatcher:
+    # Coalesces concurrent single-text requests into one embed_documents call
+
+    def __init__(self, embed_fn, max_batch_size, max_wait_ms):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, text):
+        future = Future()
+        self.pending.put((text, future))
+        return future
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                embs = self.embed_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), emb in zip(batch, embs):
+                future.set_result(emb)
+
+def startup(readiness):
+    global embedder, cached_embedder, batcher
+    with readiness.phase("load"):
+        embedder = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    with readiness.phase("warmup"):
+        # A single query and a full batch, so neither shape is first seen by a real request
+        embedder.embed_query("how do I reset the door controller")
+        embedder.embed_documents([f"elevator fault code E-{i} after power loss" for i in range(MAX_BATCH_SIZE)])
+    cached_embedder = CachedEmbeddings(embedder, cache)
+    batcher = MicroBatcher(embedder.embed_documents, MAX_BATCH_SIZE, MAX_WAIT_MS)
+    readiness.details["model"] = EMBEDDING_MODEL
+
+readiness.start(startup)
+
+@app.route("/health", methods=["GET"])
+def health_check():
+    return jsonify({"status": "ok", "time": time.time()})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    report, status = readiness.report()
+    return jsonify(report), status
 
 @app.route("/embed", methods=["POST"])
 def embed():
-    data = request.get_json()
+    if not readiness.ready:
+        return jsonify({"error": "Model is still loading"}), 503, {"Retry-After": "5"}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object with text or texts"}), 400
+    texts = data.get("texts")
+    if texts is not None:
+        # Checked before anything is queued: one bad item would fail every request batched with it
+        if not isinstance(texts, list) or not texts or not all(isinstance(text, str) and text for text in texts):
+            return jsonify({"error": "texts must be a non-empty list of strings"}), 400
+        try:
+            embs = []
+            for i in range(0, len(texts), MAX_BATCH_SIZE):
+                embs.extend(cached_embedder.embed_documents(texts[i:i + MAX_BATCH_SIZE]))
+            return jsonify({"embeddings": embs})
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
     text = data.get("text", "")
     if not text:
         return jsonify({"error": "No text provided"}), 400
+    if not isinstance(text, str):
+        return jsonify({"error": "text must be a string"}), 400
     try:
-        emb = embedder.embed_query(text)
+        emb = cache.get(text)
+        if emb is None:
+            emb = batcher.submit(text).result()
+            cache.put(text, emb)
         return jsonify({"embeddings": emb})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(cache.stats())
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000)
+    app.run(host="0.0.0.0", port=8000, threaded=True)
@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import PyPDF2
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from compact_store import DTYPES, build_compact_store, compact_dtype
+from lexical import LexicalIndex
+
+EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+MANIFEST_NAME = "ingest_manifest.json"
+CATALOG_NAME = "manuals.json"
+
+def extract_pdf_text(pdf_path):
+    pages = []
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_num in range(len(reader.pages)):
+            text = reader.pages[page_num].extract_text()
+            if text.strip():  # Skip empty pages
+                pages.append({
+                    "content": text,
+                    "metadata": {"source": pdf_path, "page": page_num + 1}
+                })
+    return pages
+
+def list_pdfs(directory):
+    return sorted(
+        os.path.join(directory, file)
+        for file in os.listdir(directory)
+        if file.lower().endswith('.pdf')
+    )
+
+def iter_extracted(pdf_paths, workers=None):
+    # Parse PDFs across processes, keeping only a few files' pages in flight at once. A file
+    # that fails to parse is logged and yielded with pages None.
+    workers = workers or os.cpu_count() or 1
+    paths = iter(pdf_paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        for path in paths:
+            in_flight[executor.submit(extract_pdf_text, path)] = path
+            if len(in_flight) >= 2 * workers:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                next_path = next(paths, None)
+                if next_path is not None:
+                    in_flight[executor.submit(extract_pdf_text, next_path)] = next_path
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    print(f"[ingest] skipping {path}: {type(e).__name__}: {e}")
+                    pages = None
+                yield path, pages
+
+def split_pages(pages, text_splitter):
+    documents = []
+    for page in pages:
+        documents.extend(text_splitter.create_documents(
+            [page["content"]],
+            metadatas=[page["metadata"]]
+        ))
+    return documents
+
+def load_catalog(directory, catalog_path=None):
+    # Optional JSON map from PDF filename (relative to the PDF directory) to metadata about the
+    # manual, e.g. {"MX20_install.pdf": {"equipment": "MX20", "vendor": "Kone"}}
+    catalog_path = catalog_path or os.path.join(directory, CATALOG_NAME)
+    if not os.path.exists(catalog_path):
+        return {}
+    with open(catalog_path) as f:
+        return json.load(f)
+
+def manual_metadata(name, catalog):
+    # Chunk metadata searches can filter on; equipment is lowercased so filters are case-insensitive
+    metadata = {key: value for key, value in catalog.get(name, {}).items()
+                if isinstance(value, (str, int, float, bool))}
+    metadata["manual"] = name
+    if "equipment" in metadata:
+        metadata["equipment"] = str(metadata["equipment"]).strip().lower()
+    return metadata
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# The manifest records, per PDF, the file hash and for each page its text hash and the
+# Chroma ids of its chunks, so a re-run only touches what changed.
+def load_manifest(save_path):
+    path = os.path.join(save_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"model": EMBEDDING_MODEL, "files": {}}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("model") != EMBEDDING_MODEL:
+        raise ValueError(
+            f"{save_path} was built with {manifest.get('model')}, not {EMBEDDING_MODEL}; "
+            "ingest into a new --save-path"
+        )
+    return manifest
+
+def save_manifest(save_path, manifest):
+    path = os.path.join(save_path, MANIFEST_NAME)
+    os.makedirs(save_path, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def ingest_directory(directory, save_path="data/vectorstore", batch_size=64, workers=None, catalog_path=None,
+                     compact=None):
+    from langchain_chroma import Chroma
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    manifest = load_manifest(save_path)
+    vector_store = Chroma(
+        persist_directory=save_path,
+        embedding_function=HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    )
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    catalog = load_catalog(directory, catalog_path)
+    stats = {"files": 0, "unchanged": 0, "removed": 0, "failed": 0, "pages": 0, "chunks": 0, "deleted": 0}
+
+    # The BM25 index mirrors the vector store chunk for chunk; stores built before it existed
+    # are backfilled from the chunks already in Chroma
+    new_lexical = not LexicalIndex.exists(save_path)
+    lexical = LexicalIndex(save_path)
+    if new_lexical and manifest["files"]:
+        existing = vector_store.get(include=["documents", "metadatas"])
+        lexical.add(existing["ids"], existing["documents"], existing["metadatas"])
+
+    def add(documents, ids):
+        vector_store.add_documents(documents, ids=ids)
+        lexical.add(ids, [document.page_content for document in documents],
+                    [document.metadata for document in documents])
+        stats["chunks"] += len(documents)
+
+    def delete(ids):
+        if ids:
+            vector_store.delete(ids=ids)
+            lexical.delete(ids)
+            stats["deleted"] += len(ids)
+
+    current = {os.path.relpath(path, directory): path for path in list_pdfs(directory)}
+    for name in list(manifest["files"]):
+        if name not in current:
+            delete([i for page in manifest["files"][name]["pages"].values() for i in page["ids"]])
+            del manifest["files"][name]
+            stats["removed"] += 1
+    save_manifest(save_path, manifest)
+
+    # A file is re-read when its bytes or its catalog metadata changed
+    hashes, metadata = {}, {}
+    for name, path in current.items():
+        hashes[path] = file_sha256(path)
+        metadata[path] = manual_metadata(name, catalog)
+    changed = []
+    for name, path in current.items():
+        entry = manifest["files"].get(name, {})
+        if entry.get("sha256") == hashes[path] and entry.get("metadata") == metadata[path]:
+            stats["unchanged"] += 1
+        else:
+            changed.append(path)
+
+    for path, pages in iter_extracted(changed, workers):
+        name = os.path.relpath(path, directory)
+        if pages is None:
+            # Its manifest entry and chunks stay as they were, so the next run tries it again
+            stats["failed"] += 1
+            continue
+        old_pages = manifest["files"].get(name, {}).get("pages", {})
+        new_pages = {}
+        batch, ids = [], []
+        metadata_json = json.dumps(metadata[path], sort_keys=True)
+        for page in pages:
+            page["metadata"].update(metadata[path])
+            key = str(page["metadata"]["page"])
+            # Metadata is part of the page hash, so re-cataloguing a manual re-indexes its chunks
+            page_hash = text_sha256(metadata_json + page["content"])
+            old = old_pages.pop(key, None)
+            if old is not None and old["sha256"] == page_hash:
+                new_pages[key] = old
+                continue
+            if old is not None:
+                delete(old["ids"])
+            documents = split_pages([page], text_splitter)
+            page_ids = [f"{name}:{key}:{page_hash[:16]}:{i}" for i in range(len(documents))]
+            new_pages[key] = {"sha256": page_hash, "ids": page_ids}
+            stats["pages"] += 1
+            batch.extend(documents)
+            ids.extend(page_ids)
+            while len(batch) >= batch_size:
+                add(batch[:batch_size], ids[:batch_size])
+                batch, ids = batch[batch_size:], ids[batch_size:]
+        if batch:
+            add(batch, ids)
+        # Pages that vanished from the new version of the file
+        delete([i for page in old_pages.values() for i in page["ids"]])
+
+        manifest["files"][name] = {"sha256": hashes[path], "metadata": metadata[path], "pages": new_pages}
+        save_manifest(save_path, manifest)
+        stats["files"] += 1
+        print(f"[ingest] {name}: {len(pages)} pages")
+
+    # The compact export is rebuilt whole from Chroma whenever the store changed
+    compact = compact or compact_dtype(save_path)
+    changed = stats["files"] or stats["removed"] or compact != compact_dtype(save_path)
+    if compact and changed:
+        stats["compact"] = build_compact_store(vector_store, save_path, compact)
+        print(f"[ingest] compact {compact} store: {stats['compact']} vectors")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed a directory of PDF manuals into the vector store")
+    parser.add_argument("pdf_dir", nargs="?", default="data/pdfs")
+    parser.add_argument("--save-path", default="data/vectorstore")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embedding call")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes")
+    parser.add_argument("--catalog", default=None, help=f"manual metadata JSON (default: <pdf_dir>/{CATALOG_NAME})")
+    parser.add_argument("--compact", choices=DTYPES, default=None,
+                        help="also export a quantized copy for VECTOR_STORE=compact (kept up to date once built)")
+    args = parser.parse_args()
+
+    start = time.time()
+    stats = ingest_directory(args.pdf_dir, args.save_path, args.batch_size, args.workers, args.catalog, args.compact)
+    print(
+        f"[ingest] {stats['files']} files updated ({stats['pages']} pages, {stats['chunks']} chunks), "
+        f"{stats['unchanged']} unchanged, {stats['removed']} removed, {stats['failed']} failed, "
+        f"{stats['deleted']} stale chunks deleted in {time.time() - start:.1f}s"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+class QueueFull(Exception):
+    pass
+
+class JobQueue:
+    # Persistent job queue in SQLite with a pool of worker threads. A job is a kind (a key of
+    # handlers), JSON params and an optional binary payload such as uploaded audio; its result
+    # is stored as JSON. Finished jobs are deleted retention_s after they finish.
+    #
+    # Several processes may share the file. A worker claims a job with a conditional UPDATE and
+    # holds it under a lease its process keeps renewing; a job whose lease ran out (its process
+    # died) is claimed again, up to max_attempts times. Waits are timed, so jobs and results
+    # written by other processes are seen within poll_s.
+
+    def __init__(self, path, handlers, workers=2, max_queued=256, retention_s=86400, lease_s=60,
+                 max_attempts=3, poll_s=1.0):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.handlers = handlers
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention_s
+        self.lease = lease_s
+        self.max_attempts = max_attempts
+        self.poll = poll_s
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT, status TEXT, params TEXT, payload BLOB,
+                result TEXT, error TEXT, created_at REAL, started_at REAL, finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+        """)
+        # Queues created before jobs carried leases
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL"), ("attempts", "INTEGER DEFAULT 0")):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        # Jobs they left running have no lease, so they are claimable straight away
+        self.db.execute("UPDATE jobs SET lease_until = 0 WHERE status = 'running' AND lease_until IS NULL")
+        self.db.commit()
+
+    @classmethod
+    def from_env(cls, handlers):
+        return cls(
+            os.environ.get("JOBS_DB_PATH", "data/jobs.sqlite3"),
+            handlers,
+            workers=int(os.environ.get("JOBS_WORKERS", 2)),
+            max_queued=int(os.environ.get("JOBS_MAX_QUEUED", 256)),
+            retention_s=float(os.environ.get("JOBS_RETENTION_S", 86400)),
+            lease_s=float(os.environ.get("JOBS_LEASE_S", 60)),
+        )
+
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+        threading.Thread(target=self._renew, daemon=True).start()
+
+    def submit(self, kind, params=None, payload=None):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind}")
+        job_id = uuid.uuid4().hex
+        with self.changed:
+            self.db.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.retention,))
+            (queued,) = self.db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+            if queued >= self.max_queued:
+                self.db.commit()
+                raise QueueFull(f"{queued} jobs already queued")
+            self.db.execute(
+                "INSERT INTO jobs (id, kind, status, params, payload, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params or {}), payload, time.time())
+            )
+            self.db.commit()
+            self.changed.notify_all()
+        return job_id
+
+    def get(self, job_id, wait=0, seen_status=None):
+        # Job status and, once finished, its result or error. With wait, blocks up to that many
+        # seconds for the job to move on from seen_status (by default, to finish).
+        deadline = time.monotonic() + wait
+        with self.changed:
+            while True:
+                job = self._get(job_id)
+                if job is None or job["status"] in ("done", "failed"):
+                    return job
+                if seen_status is not None and job["status"] != seen_status:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self.changed.wait(min(remaining, self.poll))
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"workers": self.workers, "max_queued": self.max_queued, **counts}
+
+    def _get(self, job_id):
+        row = self.db.execute(
+            "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "kind", "status", "result", "error", "created_at", "started_at", "finished_at"), row))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        if job["status"] == "queued":
+            (job["position"],) = self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job["created_at"],)
+            ).fetchone()
+        return job
+
+    def _claim(self):
+        # Oldest claimable job: queued, or running under a lease that ran out. The UPDATE only
+        # succeeds if the row is still claimable, so one process wins when several race for it.
+        claimable = "(status = 'queued' OR (status = 'running' AND lease_until < ?))"
+        with self.changed:
+            while True:
+                now = time.time()
+                self.db.execute(
+                    f"UPDATE jobs SET status = 'failed', error = 'Abandoned after {self.max_attempts} attempts', "
+                    f"finished_at = ?, payload = NULL WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = self.db.execute(
+                    f"SELECT id, kind, params, payload FROM jobs WHERE {claimable} ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    cursor = self.db.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, started_at = ?, "
+                        f"attempts = attempts + 1 WHERE id = ? AND {claimable}",
+                        (self.owner, now + self.lease, now, row[0], now)
+                    )
+                    self.db.commit()
+                    if cursor.rowcount == 1:
+                        self.changed.notify_all()
+                        return row
+                    continue
+                self.db.commit()
+                self.changed.wait(self.poll)
+
+    def _renew(self):
+        # Keeps this process's running jobs leased while their handlers run
+        while True:
+            time.sleep(self.lease / 3)
+            with self.lock:
+                self.db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                    (time.time() + self.lease, self.owner)
+                )
+                self.db.commit()
+
+    def _work(self):
+        while True:
+            job_id, kind, params, payload = self._claim()
+            try:
+                result = self.handlers[kind](json.loads(params), payload)
+                update = ("done", json.dumps(result), None)
+            except Exception as e:
+                print(f"[jobs] {kind} job {job_id} failed: {e}")
+                update = ("failed", None, str(e))
+            with self.changed:
+                # The payload is only needed to run the job. A job reclaimed by another process
+                # after this one lost its lease is left to that process.
+                self.db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, payload = NULL "
+                    "WHERE id = ? AND owner = ? AND status = 'running'",
+                    (*update, time.time(), job_id, self.owner)
+                )
+                self.db.commit()
+                self.changed.notify_all()
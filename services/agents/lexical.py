@@ -0,0 +1,148 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+INDEX_NAME = "lexical.sqlite3"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i if in is it its of on or that the this to was
+were what when where which will with you your do does not can
+""".split())
+
+def tokenize(text):
+    # Part numbers and fault codes ("MX20", "E-47") stay whole; compound tokens also index their
+    # parts and the joined form, so "E47" and "e 47" both reach "E-47"
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+class LexicalIndex:
+    # BM25 inverted index over the vector store's chunks, stored next to it in SQLite and keyed
+    # by the same chunk ids, so ingestion can add and delete chunks in both together
+
+    def __init__(self, save_path, k1=1.5, b=0.75):
+        os.makedirs(save_path, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(save_path, INDEX_NAME), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY, length INTEGER, manual TEXT, equipment TEXT, page INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_id TEXT, tf INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_postings_term ON postings(term);
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+        """)
+        # Indexes created before chunks carried manual metadata
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(docs)")}
+        for column, kind in (("manual", "TEXT"), ("equipment", "TEXT"), ("page", "INTEGER")):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE docs ADD COLUMN {column} {kind}")
+        self.db.commit()
+
+    @staticmethod
+    def exists(save_path):
+        return os.path.exists(os.path.join(save_path, INDEX_NAME))
+
+    def add(self, ids, texts, metadatas=None):
+        metadatas = metadatas or [{}] * len(ids)
+        with self.lock:
+            self._delete(ids)
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                self.db.execute(
+                    "INSERT INTO docs VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, sum(counts.values()), metadata.get("manual"), metadata.get("equipment"),
+                     metadata.get("page"))
+                )
+                self.db.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in counts.items()]
+                )
+            self.db.commit()
+
+    def delete(self, ids):
+        with self.lock:
+            self._delete(ids)
+            self.db.commit()
+
+    def _delete(self, ids):
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            self.db.execute(f"DELETE FROM postings WHERE doc_id IN ({marks})", batch)
+            self.db.execute(f"DELETE FROM docs WHERE id IN ({marks})", batch)
+
+    def search(self, query, k=10, manual=None, equipment=None, pages=None):
+        # Optional filters restrict results to some manuals, equipment types or a page range.
+        # BM25 statistics (document count, average length and document frequencies) are all
+        # taken over the filtered chunks, as if the index held only them.
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        where, params = ["1 = 1"], []
+        for column, values in (("manual", manual), ("equipment", equipment)):
+            if values:
+                values = [values] if isinstance(values, str) else list(values)
+                where.append(f"d.{column} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+        if pages:
+            first, last = pages
+            if first is not None:
+                where.append("d.page >= ?")
+                params.append(first)
+            if last is not None:
+                where.append("d.page <= ?")
+                params.append(last)
+        where = " AND ".join(where)
+        sql = (
+            "SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id "
+            f"WHERE p.term IN ({','.join('?' * len(terms))}) AND {where}"
+        )
+        with self.lock:
+            n_docs, avg_length = self.db.execute(f"SELECT COUNT(*), AVG(length) FROM docs d WHERE {where}",
+                                                 params).fetchone()
+            rows = self.db.execute(sql, terms + params).fetchall()
+        if not n_docs:
+            return []
+        postings = defaultdict(list)
+        for term, doc_id, tf, length in rows:
+            postings[term].append((doc_id, tf, length))
+        scores = defaultdict(float)
+        for term, docs in postings.items():
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf, length in docs:
+                norm = self.k1 * (1 - self.b + self.b * length / (avg_length or 1))
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+_indexes = {}
+_lock = threading.Lock()
+
+def get_lexical_index(save_path):
+    # One connection per store directory; SQLite readers see each ingest's commits as they land
+    with _lock:
+        if save_path not in _indexes:
+            _indexes[save_path] = LexicalIndex(save_path)
+        return _indexes[save_path]
+
+def reciprocal_rank_fusion(rankings, weights, k=60):
+    # rankings are lists of ids, best first; returns ids ordered by weighted sum of 1 / (k + rank)
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
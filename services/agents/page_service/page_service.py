@@ -0,0 +1,82 @@
+import os
+import time
+
+from flask import Flask, Response, request, jsonify
+
+from pages import PageCache, PageIndex, render_png
+from readiness import Readiness
+
+MANUALS_DIR = os.environ.get("MANUALS_DIR", "data/pdfs")
+CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", "data/page_cache")
+THUMBNAIL_WIDTH = int(os.environ.get("PAGE_THUMBNAIL_WIDTH", 800))
+
+app = Flask(__name__)
+readiness = Readiness("page_service")
+index = PageIndex(MANUALS_DIR, CACHE_DIR)
+cache = PageCache.from_env(CACHE_DIR)
+
+MIMETYPES = {"pdf": "application/pdf", "png": "image/png"}
+
+def startup(readiness):
+    with readiness.phase("index"):
+        readiness.details["manuals"] = len(index.build())
+
+readiness.start(startup)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'ok', 'time': time.time()})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    report, status = readiness.report()
+    return jsonify(report), status
+
+@app.route('/pages/<path:manual>/<int:page>.<fmt>', methods=['GET'])
+def get_page(manual, page, fmt):
+    # One page of a manual, as a one-page PDF or a PNG PAGE_THUMBNAIL_WIDTH pixels wide
+    # (?width= overrides it). manual is the PDF's path under MANUALS_DIR, as in search results.
+    if fmt not in MIMETYPES:
+        return jsonify({'error': 'format must be pdf or png'}), 404
+    entry = index.lookup(manual)
+    if entry is None:
+        return jsonify({'error': f'No manual {manual}'}), 404
+    if not 1 <= page <= entry['pages']:
+        return jsonify({'error': f'{manual} has {entry["pages"]} pages'}), 404
+    width = min(max(request.args.get('width', THUMBNAIL_WIDTH, type=int), 64), 2400) if fmt == 'png' else None
+    key = f"{entry['version']}-{page}" + (f"-{width}.png" if fmt == 'png' else ".pdf")
+    etag = f'"{key}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+
+    data = cache.get(key)
+    if data is None:
+        pdf_key = f"{entry['version']}-{page}.pdf"
+        pdf = cache.get(pdf_key) if fmt == 'png' else None
+        if pdf is None:
+            pdf = index.extract(manual, page)
+            cache.put(pdf_key, pdf)
+        if fmt == 'png':
+            try:
+                data = render_png(pdf, width)
+            except ImportError:
+                return jsonify({'error': 'PNG rendering needs pypdfium2'}), 501
+            cache.put(key, data)
+        else:
+            data = pdf
+    # Keys change whenever the manual does, so clients may keep pages indefinitely
+    return Response(data, mimetype=MIMETYPES[fmt], headers={
+        'ETag': etag,
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    })
+
+@app.route('/manuals', methods=['GET'])
+def manuals():
+    return jsonify({name: entry['pages'] for name, entry in index.entries.items()})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({'manuals': len(index.entries), 'cache': cache.stats()})
+
+if __name__ == "__main__":
+    app.run(host='0.0.0.0', port=8003, threaded=True)
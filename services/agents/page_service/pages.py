@@ -0,0 +1,222 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PyPDF2 import PdfReader, PdfWriter
+
+INDEX_NAME = "index.json"
+
+class PageIndex:
+    # Per manual: size, mtime and page count, persisted in the cache directory so a restart
+    # only re-reads manuals that changed. The version derived from size and mtime is part of
+    # every cache key, so pages of a replaced manual are never served stale.
+    #
+    # Open readers are kept in an LRU. PyPDF2 reads a file's cross-reference table (the byte
+    # offset of every object) when it opens it and then seeks straight to the objects of the
+    # requested page, so extracting a page from an open manual never re-reads the whole file.
+
+    def __init__(self, manuals_dir, cache_dir, max_open=16):
+        self.manuals_dir = os.path.realpath(manuals_dir)
+        self.path = os.path.join(cache_dir, INDEX_NAME)
+        self.max_open = max_open
+        self.entries = {}
+        self.readers = OrderedDict()  # name -> (version, file, reader)
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()  # one rebuild at a time; it may take a while
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def build(self):
+        # Brings the index up to date with the manuals directory
+        with self.build_lock:
+            return self._build()
+
+    def _build(self):
+        current = {}
+        for root, _, files in os.walk(self.manuals_dir):
+            for file in files:
+                if file.lower().endswith(".pdf"):
+                    path = os.path.join(root, file)
+                    current[os.path.relpath(path, self.manuals_dir)] = path
+        entries = {}
+        for name, path in sorted(current.items()):
+            stat = os.stat(path)
+            entry = self.entries.get(name)
+            if not _current(entry, stat):
+                with open(path, "rb") as f:
+                    pages = len(PdfReader(f).pages)
+                entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "pages": pages}
+            entry["version"] = hashlib.sha256(f"{name}\0{entry['size']}\0{entry['mtime_ns']}".encode()).hexdigest()[:16]
+            entries[name] = entry
+        with self.lock:
+            self.entries = entries
+        write_atomic(self.path, json.dumps(entries).encode())
+        return entries
+
+    def lookup(self, name):
+        # Index entry for a manual, re-checked against the file so replaced manuals are picked up
+        path = os.path.realpath(os.path.join(self.manuals_dir, name))
+        if not path.startswith(self.manuals_dir + os.sep) or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(name)
+        if not _current(entry, stat):
+            with self.build_lock:
+                # Requests that saw the same change wait here; the first one rebuilds
+                with self.lock:
+                    entry = self.entries.get(name)
+                if not _current(entry, stat):
+                    self._build()
+                    with self.lock:
+                        entry = self.entries.get(name)
+        return entry
+
+    def extract(self, name, page):
+        # The 1-based page as a standalone one-page PDF
+        entry = self.lookup(name)
+        with self.lock:
+            cached = self.readers.get(name)
+            if cached is None or cached[0] != entry["version"]:
+                if cached is not None:
+                    cached[1].close()
+                file = open(os.path.join(self.manuals_dir, name), "rb")
+                cached = (entry["version"], file, PdfReader(file))
+                self.readers[name] = cached
+            self.readers.move_to_end(name)
+            while len(self.readers) > self.max_open:
+                _, (_, file, _) = self.readers.popitem(last=False)
+                file.close()
+            # Page objects are read lazily from the shared file, so writing stays under the lock
+            writer = PdfWriter()
+            writer.add_page(cached[2].pages[page - 1])
+            output = io.BytesIO()
+            writer.write(output)
+        return output.getvalue()
+
+def _current(entry, stat):
+    return entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+def write_atomic(path, data):
+    # Writes through a uniquely named temporary file, so concurrent writers of the same path
+    # never share one and readers only ever see a complete file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def render_png(pdf_bytes, width):
+    # Rasterizes a one-page PDF to a PNG `width` pixels wide
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(pdf_bytes)
+    try:
+        page = document[0]
+        image = page.render(scale=width / page.get_width()).to_pil()
+    finally:
+        document.close()
+    output = io.BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
+
+class PageCache:
+    # Extracted and rendered pages: an in-memory LRU bounded in bytes in front of a directory
+    # of files, evicted least recently used first once it grows past disk_bytes
+
+    def __init__(self, cache_dir, memory_bytes=64 << 20, disk_bytes=1 << 30):
+        self.dir = os.path.join(cache_dir, "pages")
+        os.makedirs(self.dir, exist_ok=True)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counts = {"memory": 0, "disk": 0, "miss": 0}
+        self.disk_size = sum(entry.stat().st_size for entry in os.scandir(self.dir))
+
+    @classmethod
+    def from_env(cls, cache_dir):
+        return cls(
+            cache_dir,
+            memory_bytes=int(float(os.environ.get("PAGE_CACHE_MEMORY_MB", 64)) * (1 << 20)),
+            disk_bytes=int(float(os.environ.get("PAGE_CACHE_DISK_MB", 1024)) * (1 << 20)),
+        )
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.counts["memory"] += 1
+                return data
+        path = os.path.join(self.dir, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.counts["miss"] += 1
+            return None
+        os.utime(path)  # mtime orders disk eviction
+        with self.lock:
+            self.counts["disk"] += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        path = os.path.join(self.dir, key)
+        fd, tmp = tempfile.mkstemp(dir=self.dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self.lock:
+            # A concurrent miss may have stored the same page already; count only the difference
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+            self.disk_size += len(data) - replaced
+            evict = self.disk_size > self.disk_bytes
+        if evict:
+            self._evict_disk()
+        self._remember(key, data)
+
+    def stats(self):
+        with self.lock:
+            return {"memory_entries": len(self.entries), "memory_bytes": self.size,
+                    "disk_bytes": self.disk_size, **self.counts}
+
+    def _remember(self, key, data):
+        with self.lock:
+            if key in self.entries or len(data) > self.memory_bytes:
+                return
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.memory_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _evict_disk(self):
+        # Oldest files go first until the directory is back to 90% of its budget
+        # Temporary files belong to writes still in progress
+        files = sorted((entry for entry in os.scandir(self.dir) if not entry.name.startswith(".tmp-")),
+                       key=lambda entry: entry.stat().st_mtime_ns)
+        size = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if size <= self.disk_bytes * 0.9:
+                break
+            size -= entry.stat().st_size
+            os.remove(entry.path)
+        with self.lock:
+            self.disk_size = size
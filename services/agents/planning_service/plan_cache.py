@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+class CacheLookup:
+    def __init__(self, key=None, scope_key=None, embedding=None, plan=None, tier=None, cacheable=True):
+        self.key = key
+        self.scope_key = scope_key
+        self.embedding = embedding
+        self.plan = plan
+        self.tier = tier
+        self.cacheable = cacheable
+
+class PlanCache:
+    # Generated plans keyed on the whitespace-normalized prompt plus the generation parameters,
+    # with a TTL and LRU eviction past max_entries. With a semantic_threshold, a miss falls back
+    # to the cached entry whose text (the instruction) is most similar, by cosine over bge
+    # embeddings from the embedding service, among those with the same parameters and exactly
+    # the same scope (the context and response format). Only the short instruction is embedded,
+    # as bge truncates at 512 tokens and would otherwise drop it behind a long context.
+
+    def __init__(self, max_entries=1024, ttl_s=3600, semantic_threshold=0.0, embed_url=None,
+                 deterministic_only=False):
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self.semantic_threshold = semantic_threshold
+        self.embed_url = embed_url
+        self.deterministic_only = deterministic_only
+        self.entries = OrderedDict()  # key -> (plan, expires_at, scope_key, embedding)
+        self.lock = threading.Lock()
+        self.counts = {"exact": 0, "semantic": 0, "miss": 0}
+        self.session = requests.Session()
+
+    @classmethod
+    def from_env(cls):
+        host = os.environ.get("EMBEDDING_SERVICE_HOST", "embedding_service")
+        port = os.environ.get("EMBEDDING_SERVICE_PORT", 8000)
+        return cls(
+            max_entries=int(os.environ.get("PLAN_CACHE_SIZE", 1024)),
+            ttl_s=float(os.environ.get("PLAN_CACHE_TTL_S", 3600)),
+            semantic_threshold=float(os.environ.get("PLAN_CACHE_SEMANTIC_THRESHOLD", 0)),
+            embed_url=f"http://{host}:{port}/embed",
+            deterministic_only=os.environ.get("PLAN_CACHE_DETERMINISTIC_ONLY", "0") == "1",
+        )
+
+    def lookup(self, prompt, params, scope="", text=None, semantic=True):
+        # scope must match exactly for a semantic hit and text is what gets embedded;
+        # semantic=False limits the lookup to exact hits
+        if self.deterministic_only and params.get("do_sample"):
+            return CacheLookup(cacheable=False)
+        prompt = " ".join(prompt.split())
+        params_key = json.dumps({k: v for k, v in params.items() if k != "max_time"}, sort_keys=True)
+        key = hashlib.sha256(f"{params_key}\0{prompt}".encode("utf-8")).hexdigest()
+        scope_key = hashlib.sha256(f"{params_key}\0{' '.join(scope.split())}".encode("utf-8")).hexdigest()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.counts["exact"] += 1
+                return CacheLookup(key, scope_key, entry[3], plan=entry[0], tier="exact")
+
+        embedding = None
+        if self.semantic_threshold > 0 and text and semantic:
+            embedding = self._embed(" ".join(text.split()))
+        with self.lock:
+            if embedding is not None:
+                best, best_score = None, self.semantic_threshold
+                for plan, expires_at, entry_scope, entry_embedding in self.entries.values():
+                    if expires_at <= now or entry_scope != scope_key or entry_embedding is None:
+                        continue
+                    score = float(np.dot(embedding, entry_embedding))
+                    if score >= best_score:
+                        best, best_score = plan, score
+                if best is not None:
+                    self.counts["semantic"] += 1
+                    return CacheLookup(key, scope_key, embedding, plan=best, tier="semantic")
+            self.counts["miss"] += 1
+        return CacheLookup(key, scope_key, embedding)
+
+    def store(self, lookup, plan):
+        if not lookup.cacheable or lookup.tier is not None:
+            return
+        with self.lock:
+            self.entries[lookup.key] = (plan, time.time() + self.ttl, lookup.scope_key, lookup.embedding)
+            self.entries.move_to_end(lookup.key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), **self.counts}
+
+    def _embed(self, text):
+        # The semantic tier is best effort: without the embedding service only exact hits apply
+        try:
+            response = self.session.post(self.embed_url, json={"text": text}, timeout=1)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        embedding = np.asarray(response.json()["embeddings"], dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
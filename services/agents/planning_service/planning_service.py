@@ -1,39 +1,124 @@
-from flask import Flask, request, jsonify
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
+import os
+import time
+
+from plan_cache import PlanCache
+from readiness import Readiness
+from runtime import load_scheduler
+from scheduler import QueueFull
 
 app = Flask(__name__)
+readiness = Readiness("planning_service")
+scheduler = None  # set by startup()
+
+plan_cache = PlanCache.from_env()
+
+# Latency budget per plan, in seconds; generation stops early when it runs out
+MAX_TIME = float(os.environ.get("PLAN_MAX_TIME_S", 0)) or None
 
-# Load model and tokenizer via Hugging Face Transformers
-model = "openchat/openchat-3.5-0106"
+def make_prefix(context):
+    # Shared by every request about the same context, its KV states are cached
+    return f"Given the following context:\n{context}\n\n"
 
-tokenizer = AutoTokenizer.from_pretrained(model)
-model = AutoModelForCausalLM.from_pretrained(model)
-generator = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    device=0  # set to -1 for CPU, 0 for first CUDA GPU
-)
+# Closing line of the prompt for each response_format
+RESPONSE_FORMATS = {
+    "plan": "Return a step-by-step plan to accomplish the task.",
+    "json": "Return only a JSON object, with no other text.",
+}
 
-def make_prompt(context, instruction):
+def make_prompt(context, instruction, response_format="plan"):
     return (
-        f"Given the following context:\n{context}\n\n"
-        f"Instruction:\n{instruction}\n\n"
-        "Return a step-by-step plan to accomplish the task."
+        make_prefix(context) +
+        f"Instruction:\n{instruction}\n\n" +
+        RESPONSE_FORMATS[response_format]
     )
 
+def startup(readiness):
+    global scheduler
+    with readiness.phase("load"):
+        # Model, device and quantization come from PLANNING_RUNTIME / PLANNING_MODEL (see runtime.py)
+        scheduler = load_scheduler()
+    with readiness.phase("warmup"):
+        # A short greedy generation runs prefill and decode once, outside the plan cache
+        context = "Elevator MX20, door does not close fully, fault code E-47."
+        scheduler.submit(
+            make_prompt(context, "Inspect the door operator."),
+            prefix=make_prefix(context),
+            max_new_tokens=8,
+            do_sample=False,
+        ).result()
+
+readiness.start(startup)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({'status': 'ok', 'time': time.time()})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    report, status = readiness.report()
+    return jsonify(report), status
+
 @app.route('/plan', methods=['POST'])
 def plan():
+    if not readiness.ready:
+        return jsonify({'error': 'Model is still loading'}), 503, {'Retry-After': '5'}
     data = request.get_json()
     context = data.get('context', '')
     instruction = data.get('instruction', '')
     if not context or not instruction:
         return jsonify({'error': 'context and instruction are required.'}), 400
-    prompt = make_prompt(context, instruction)
-    result = generator(prompt, max_new_tokens=256, do_sample=True, temperature=0.7)[0]['generated_text']
-    # Extract plan after "Instruction:" if the model echoes the prompt
-    plan_text = result.split("Instruction:")[-1].strip()
+    response_format = data.get('response_format', 'plan')
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({'error': f'response_format must be one of {sorted(RESPONSE_FORMATS)}'}), 400
+    prompt = make_prompt(context, instruction, response_format)
+    options = {
+        'max_new_tokens': int(data.get('max_new_tokens', 256)),
+        'do_sample': bool(data.get('do_sample', True)),
+        'temperature': float(data.get('temperature', 0.7)),
+        'stop': data.get('stop') or [],
+        'max_time': data.get('max_time') or MAX_TIME,
+    }
+    # "cache": "exact" skips the semantic tier, for callers that need an answer to exactly this instruction
+    cached = plan_cache.lookup(
+        prompt, options,
+        scope=f"{response_format}\0{context}", text=instruction,
+        semantic=data.get('cache', 'semantic') != 'exact',
+    )
+    if cached.plan is not None:
+        if data.get('stream'):
+            lines = [json.dumps({'token': cached.plan}), json.dumps({'plan': cached.plan, 'done': True, 'cached': cached.tier})]
+            return Response('\n'.join(lines) + '\n', mimetype='application/x-ndjson')
+        return jsonify({'plan': cached.plan, 'cached': cached.tier})
+    try:
+        generation = scheduler.submit(prompt, prefix=make_prefix(context), **options)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+    if data.get('stream'):
+        return Response(stream_with_context(stream_plan(generation, cached)), mimetype='application/x-ndjson')
+    # Only newly generated tokens are decoded, so the prompt is never echoed back
+    plan_text = generation.result()
+    cache_plan(cached, generation)
     return jsonify({'plan': plan_text})
 
+def stream_plan(generation, cached):
+    # One JSON line per decoded text piece as the model produces it, then the full plan
+    for piece in generation.stream():
+        yield json.dumps({'token': piece}) + '\n'
+    cache_plan(cached, generation)
+    yield json.dumps({'plan': generation.text, 'done': True}) + '\n'
+
+def cache_plan(cached, generation):
+    # Plans cut short by the latency budget are not worth serving again
+    if not generation.expired():
+        plan_cache.store(cached, generation.text)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    if scheduler is None:
+        return jsonify(readiness.report()[0]), 503
+    return jsonify({**scheduler.stats(), 'cache': plan_cache.stats()})
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8002)
+    app.run(host='0.0.0.0', port=8002, threaded=True)
@@ -0,0 +1,65 @@
+import os
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from scheduler import BatchScheduler, LlamaCppScheduler
+
+DEFAULT_MODEL = "openchat/openchat-3.5-0106"
+# Small enough to generate on a laptop CPU, for testing the service end to end
+SMALL_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+# PLANNING_RUNTIME:
+#   cuda      fp16 weights on the first GPU
+#   cpu       fp32 weights on CPU
+#   cpu-int8  fp32 weights with every nn.Linear dynamically quantized to int8
+#   gguf      llama.cpp on a (typically int4) GGUF file from PLANNING_GGUF_PATH
+#   auto      cuda when a GPU is visible, otherwise cpu-int8
+RUNTIMES = ("auto", "cuda", "cpu", "cpu-int8", "gguf")
+
+def detect_runtime():
+    return "cuda" if torch.cuda.is_available() else "cpu-int8"
+
+def resolve_model(name):
+    return {"": DEFAULT_MODEL, "default": DEFAULT_MODEL, "small": SMALL_MODEL}.get(name, name)
+
+def load_model(model_name, runtime):
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if runtime == "cuda":
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float16).to("cuda:0")
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+        if runtime == "cpu-int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model, tokenizer
+
+def load_scheduler():
+    runtime = os.environ.get("PLANNING_RUNTIME", "auto")
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown PLANNING_RUNTIME {runtime!r}, expected one of {', '.join(RUNTIMES)}")
+    if runtime == "auto":
+        runtime = detect_runtime()
+    threads = int(os.environ.get("PLANNING_THREADS", 0)) or None
+    max_queue = int(os.environ.get("PLAN_QUEUE_SIZE", 64))
+    prefix_cache_bytes = int(float(os.environ.get("PLAN_PREFIX_CACHE_MB", 1024)) * (1 << 20))
+    print(f"[planning] runtime={runtime}")
+
+    if runtime == "gguf":
+        return LlamaCppScheduler(
+            os.environ["PLANNING_GGUF_PATH"],
+            n_ctx=int(os.environ.get("PLANNING_CONTEXT", 4096)),
+            n_threads=threads,
+            max_queue=max_queue,
+            prefix_cache_bytes=prefix_cache_bytes,
+        )
+    if threads and runtime != "cuda":
+        torch.set_num_threads(threads)
+    model, tokenizer = load_model(resolve_model(os.environ.get("PLANNING_MODEL", "")), runtime)
+    return BatchScheduler(
+        model,
+        tokenizer,
+        max_batch_size=int(os.environ.get("PLAN_MAX_BATCH", 8)),
+        max_queue=max_queue,
+        prefix_cache_bytes=prefix_cache_bytes,
+    )
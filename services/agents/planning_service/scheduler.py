@@ -0,0 +1,355 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import torch
+from transformers import DynamicCache
+
+class QueueFull(Exception):
+    pass
+
+class GenerationRequest:
+    # input_ids are prompt token ids, or the prompt text for runtimes that tokenize themselves.
+    # max_time bounds the request's total latency, queueing included.
+
+    def __init__(self, input_ids, max_new_tokens=256, do_sample=True, temperature=0.7, stop=None, max_time=None,
+                 prefix_length=0):
+        self.input_ids = input_ids
+        self.prefix_length = prefix_length  # leading tokens shared with other requests
+        self.max_new_tokens = max_new_tokens
+        self.do_sample = do_sample
+        self.temperature = temperature
+        self.stop = stop or []
+        self.output_ids = []
+        self.next_token = None  # sampled but not yet fed through the model
+        self.text = ""
+        self.error = None
+        self.pieces = queue.Queue()
+        self.done = threading.Event()
+        self.deadline = time.monotonic() + max_time if max_time else None
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def finish(self, error=None):
+        self.error = error
+        self.pieces.put(None)
+        self.done.set()
+
+    def stream(self):
+        # Yields text pieces as they are decoded
+        while True:
+            piece = self.pieces.get()
+            if piece is None:
+                break
+            yield piece
+        if self.error is not None:
+            raise self.error
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+class ThroughputMeter:
+    def __init__(self, window_s=10.0):
+        self.window = window_s
+        self.recent = deque()  # timestamps of tokens generated within the window
+        self.total = 0
+
+    def count(self):
+        now = time.monotonic()
+        self.total += 1
+        self.recent.append(now)
+        while self.recent and now - self.recent[0] > self.window:
+            self.recent.popleft()
+
+    def tokens_per_sec(self):
+        now = time.monotonic()
+        return sum(1 for t in list(self.recent) if now - t <= self.window) / self.window
+
+class PrefixCache:
+    # KV states of shared prompt prefixes, keyed on their token ids, evicted LRU once their
+    # total size exceeds budget_bytes
+
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def nbytes(past):
+        return sum(t.numel() * t.element_size() for layer in past for t in layer)
+
+    def get(self, key):
+        past = self.entries.get(key)
+        if past is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return past
+
+    def put(self, key, past):
+        size = self.nbytes(past)
+        if key in self.entries or size > self.budget:
+            return
+        self.entries[key] = past
+        self.size += size
+        while self.size > self.budget:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self.nbytes(evicted)
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+def _legacy(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+def _left_pad(tensor, n):
+    if n == 0:
+        return tensor
+    batch, heads, _, dim = tensor.shape
+    return torch.cat([tensor.new_zeros(batch, heads, n, dim), tensor], dim=2)
+
+class BatchScheduler:
+    # Continuous (iteration-level) batching: one thread owns the model and runs decode steps
+    # over every active request at once. Waiting requests are prefilled and joined to the running
+    # batch between steps, and finished ones leave it without waiting for the rest.
+    #
+    # The batch KV cache is left padded to a common length; self.pads holds each row's padding,
+    # which is masked out of attention and subtracted to get each row's position ids.
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_queue=64, prefix_cache_bytes=1 << 30):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = model.device
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, list) else [eos])
+        self.max_batch_size = max_batch_size
+        self.pending = queue.Queue(maxsize=max_queue)
+        self.active = []
+        self.cache = None
+        self.pads = []
+        self.meter = ThroughputMeter()
+        self.prefix_cache = PrefixCache(prefix_cache_bytes)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, prompt, prefix="", **options):
+        # prompt must start with prefix. The two are tokenized separately so the prefix always
+        # maps to the same token ids and its KV states can be reused across requests.
+        if prefix and prompt.startswith(prefix) and len(prompt) > len(prefix):
+            prefix_ids = self.tokenizer(prefix)["input_ids"]
+            rest_ids = self.tokenizer(prompt[len(prefix):], add_special_tokens=False)["input_ids"]
+            request = GenerationRequest(prefix_ids + rest_ids, prefix_length=len(prefix_ids), **options)
+        else:
+            request = GenerationRequest(self.tokenizer(prompt)["input_ids"], **options)
+        try:
+            self.pending.put_nowait(request)
+        except queue.Full:
+            raise QueueFull(f"{self.pending.maxsize} generations already queued")
+        return request
+
+    def stats(self):
+        return {
+            "queue_depth": self.pending.qsize(),
+            "active": len(self.active),
+            "max_batch_size": self.max_batch_size,
+            "tokens_per_sec": self.meter.tokens_per_sec(),
+            "tokens_total": self.meter.total,
+            "prefix_cache": self.prefix_cache.stats(),
+        }
+
+    def _run(self):
+        while True:
+            try:
+                with torch.inference_mode():
+                    self._admit()
+                    if self.active:
+                        self._step()
+            except Exception as e:
+                # Fail the running batch but keep serving
+                for request in self.active:
+                    request.finish(e)
+                self.active, self.cache, self.pads = [], None, []
+
+    def _admit(self):
+        while len(self.active) < self.max_batch_size:
+            try:
+                # Only block when there is nothing to decode
+                request = self.pending.get(block=not self.active)
+            except queue.Empty:
+                return
+            try:
+                past, logits = self._prefill(request)
+                if not self._accept(request, self._sample(logits, request)):
+                    self._join(request, past)
+            except Exception as e:
+                request.finish(e)
+
+    def _prefill(self, request):
+        # Only the part of the prompt after a cached prefix needs a forward pass. DynamicCache
+        # appends by concatenation, so cached tensors are never modified in place.
+        n = request.prefix_length
+        key = tuple(request.input_ids[:n]) if n else None
+        cached = self.prefix_cache.get(key) if key else None
+        if cached is not None:
+            input_ids = torch.tensor([request.input_ids[n:]], device=self.device)
+            out = self.model(
+                input_ids=input_ids,
+                past_key_values=DynamicCache.from_legacy_cache(cached),
+                use_cache=True,
+            )
+            return _legacy(out.past_key_values), out.logits[0, -1]
+
+        input_ids = torch.tensor([request.input_ids], device=self.device)
+        out = self.model(input_ids=input_ids, use_cache=True)
+        past = _legacy(out.past_key_values)
+        if key:
+            self.prefix_cache.put(key, tuple((k[:, :, :n].clone(), v[:, :, :n].clone()) for k, v in past))
+        return past, out.logits[0, -1]
+
+    def _join(self, request, past):
+        length = past[0][0].shape[2]
+        if self.cache is None:
+            self.cache, self.pads, self.active = past, [0], [request]
+            return
+        cache_length = self.cache[0][0].shape[2]
+        target = max(cache_length, length)
+        self.cache = tuple(
+            (
+                torch.cat([_left_pad(k, target - cache_length), _left_pad(new_k, target - length)]),
+                torch.cat([_left_pad(v, target - cache_length), _left_pad(new_v, target - length)]),
+            )
+            for (k, v), (new_k, new_v) in zip(self.cache, past)
+        )
+        self.pads = [pad + target - cache_length for pad in self.pads] + [target - length]
+        self.active.append(request)
+
+    def _step(self):
+        cache_length = self.cache[0][0].shape[2]
+        input_ids = torch.tensor([[r.next_token] for r in self.active], device=self.device)
+        position_ids = torch.tensor([[cache_length - pad] for pad in self.pads], device=self.device)
+        attention_mask = torch.ones(len(self.active), cache_length + 1, dtype=torch.long, device=self.device)
+        for i, pad in enumerate(self.pads):
+            attention_mask[i, :pad] = 0
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache.from_legacy_cache(self.cache),
+            use_cache=True,
+        )
+        self.cache = _legacy(out.past_key_values)
+        logits = out.logits[:, -1]
+        keep = [i for i, request in enumerate(self.active)
+                if not self._accept(request, self._sample(logits[i], request))]
+        if len(keep) < len(self.active):
+            self._evict(keep)
+
+    def _evict(self, keep):
+        if not keep:
+            self.active, self.cache, self.pads = [], None, []
+            return
+        index = torch.tensor(keep, device=self.device)
+        pads = [self.pads[i] for i in keep]
+        trim = min(pads)  # columns that are now padding in every row
+        self.cache = tuple(
+            (k.index_select(0, index)[:, :, trim:], v.index_select(0, index)[:, :, trim:])
+            for k, v in self.cache
+        )
+        self.pads = [pad - trim for pad in pads]
+        self.active = [self.active[i] for i in keep]
+
+    def _sample(self, logits, request):
+        if request.do_sample and request.temperature > 0:
+            probs = torch.softmax(logits.float() / request.temperature, dim=-1)
+            return int(torch.multinomial(probs, 1))
+        return int(torch.argmax(logits))
+
+    def _accept(self, request, token):
+        # Record a sampled token, stream any newly decoded text, return True if finished
+        self.meter.count()
+        finished = token in self.eos_ids
+        if not finished:
+            request.output_ids.append(token)
+            request.next_token = token
+        finished = finished or len(request.output_ids) >= request.max_new_tokens or request.expired()
+        text = self.tokenizer.decode(request.output_ids, skip_special_tokens=True)
+        if not text.endswith("�"):  # wait for the rest of a multi-byte character
+            for stop in request.stop:
+                if stop in text:
+                    text, finished = text[:text.index(stop)], True
+                    break
+            if text.startswith(request.text) and len(text) > len(request.text):
+                request.pieces.put(text[len(request.text):])
+            request.text = text
+        if finished:
+            request.text = request.text.strip()
+            request.finish()
+        return finished
+
+class LlamaCppScheduler:
+    # Same interface as BatchScheduler for GGUF models on llama.cpp. llama-cpp-python decodes
+    # one sequence at a time, so requests queue in front of a single generation thread.
+
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, max_queue=64, prefix_cache_bytes=1 << 30):
+        from llama_cpp import Llama, LlamaRAMCache
+
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        # llama.cpp reuses the state of the longest cached prompt prefix on its own
+        self.llm.set_cache(LlamaRAMCache(capacity_bytes=prefix_cache_bytes))
+        self.pending = queue.Queue(maxsize=max_queue)
+        self.active = None
+        self.meter = ThroughputMeter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, prompt, prefix="", **options):
+        request = GenerationRequest(prompt, **options)
+        try:
+            self.pending.put_nowait(request)
+        except queue.Full:
+            raise QueueFull(f"{self.pending.maxsize} generations already queued")
+        return request
+
+    def stats(self):
+        return {
+            "queue_depth": self.pending.qsize(),
+            "active": int(self.active is not None),
+            "max_batch_size": 1,
+            "tokens_per_sec": self.meter.tokens_per_sec(),
+            "tokens_total": self.meter.total,
+        }
+
+    def _run(self):
+        while True:
+            request = self.active = self.pending.get()
+            try:
+                chunks = self.llm.create_completion(
+                    request.input_ids,
+                    max_tokens=request.max_new_tokens,
+                    temperature=request.temperature if request.do_sample else 0.0,
+                    stop=request.stop or None,
+                    stream=True,
+                )
+                for chunk in chunks:
+                    self.meter.count()
+                    piece = chunk["choices"][0]["text"]
+                    if piece:
+                        request.text += piece
+                        request.pieces.put(piece)
+                    if request.expired():
+                        break
+                request.text = request.text.strip()
+                request.finish()
+            except Exception as e:
+                request.finish(e)
+            finally:
+                self.active = None
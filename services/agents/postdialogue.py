@@ -1,21 +1,203 @@
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+
+from chat_logs import format_turn, get_session_started_at, get_session_ticket, session_contexts
+from clients import planning_client
 
 service_report = {"Report ID":None, "Ticket Number":None, "Building Address":None, "Date & Time of Service":None,"Technician ID":None, "Spare Parts Replaced":None, "Service Duration (min)":None, "Technician Confidence Level (1–5)":None, "Safety Assessment (Safe/Unsafe)":None, "Additional Comments":None}
 
-def postprocess_service_report(report_dict):
-    # Get input from user on how the task went
-    # Collect any images if necessary
+# What the model is told each field holds. Date & Time of Service is when the session was
+# logged, not something the model reads out of it.
+FIELD_FORMATS = {
+    "Ticket Number": "string, e.g. TKT-20250101-0001",
+    "Building Address": "string",
+    "Technician ID": "string, e.g. TECH001",
+    "Spare Parts Replaced": "list of part names or numbers, [] if none were replaced",
+    "Service Duration (min)": "number of minutes",
+    "Technician Confidence Level (1–5)": "integer from 1 to 5",
+    "Safety Assessment (Safe/Unsafe)": "\"Safe\" or \"Unsafe\"",
+    "Additional Comments": "short summary of anything else worth reporting",
+}
+# Fields whose value is a judgement over the conversation rather than something said in it
+INFERRED_FIELDS = {"Technician Confidence Level (1–5)", "Safety Assessment (Safe/Unsafe)", "Additional Comments"}
 
-    # TODO Load all interactions during dialogue
-    context = None
+# Fields below this confidence are asked again, and flagged for review if they stay below it
+REPORT_CONFIDENCE_THRESHOLD = float(os.environ.get("REPORT_CONFIDENCE_THRESHOLD", 0.6))
+REPORT_MAX_REASKS = int(os.environ.get("REPORT_MAX_REASKS", 1))
+# Longer conversations keep their most recent part
+REPORT_MAX_CONTEXT_CHARS = int(os.environ.get("REPORT_MAX_CONTEXT_CHARS", 12000))
 
-    uncertainty_threshold = 1.
-    while uncertainty < uncertainty_threshold:
-        # TODO Process loaded interactions
+MINUTES_PER_UNIT = {"h": 60, "hr": 60, "hrs": 60, "hour": 60, "hours": 60,
+                    "m": 1, "min": 1, "mins": 1, "minute": 1, "minutes": 1}
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)?")
+DURATION = re.compile(r"(?:\d+(?:\.\d+)?\s*(?:hours?|hrs?|h|minutes?|mins?|m)?\s*(?:,|and)?\s*)+")
 
-        # TODO Fill dictionary, based on uncertainty
+def build_context(transcripts=(), chat_log=(), session_id=None):
+    # transcripts are strings; chat_log rows follow ai_chat_logs (user_message, ai_response,
+    # voice_transcription), oldest first. With a session_id, the session's logged turns are
+    # loaded from the database first (see chat_logs.py).
+    lines = list(session_contexts.lines(session_id)) if session_id else []
+    lines.extend(f"Technician: {text}" for text in transcripts)
+    for row in chat_log:
+        lines.extend(format_turn(row))
+    return "\n".join(lines)[-REPORT_MAX_CONTEXT_CHARS:]
 
-        # TODO Compute current uncertainty over each field entry
-        pass
+def ticket_fields(ticket):
+    # Fields known for certain from the ticket record
+    fields = {
+        "Ticket Number": ticket.get("ticket_number"),
+        "Building Address": ticket.get("location"),
+        "Technician ID": ticket.get("technician_employee_id") or ticket.get("employee_id"),
+    }
+    return {name: value for name, value in fields.items() if value}
+
+def parse_json(text):
+    # The outermost {...} of the model's answer; models sometimes wrap it in prose or fences
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+def parse_minutes(value):
+    # Minutes in a plain number or a duration such as "1.5 hours" or "1 h 30 min"; None for
+    # anything else
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value).strip().lower()
+    if not DURATION.fullmatch(text):
+        return None
+    parts = DURATION_PART.findall(text)
+    if len(parts) > 1 and not all(unit for _, unit in parts):
+        return None  # "1 30" says nothing about which number is which
+    return sum(float(number) * MINUTES_PER_UNIT.get(unit, 1) for number, unit in parts)
+
+def service_time(chat_log=(), session_id=None):
+    # Date & Time of Service: when the first logged turn was created
+    created_at = chat_log[0].get("created_at") if chat_log else None
+    if created_at is None and session_id:
+        created_at = get_session_started_at(session_id)
+    return normalize_field("Date & Time of Service", created_at)
+
+def normalize_field(name, value):
+    # Coerces a value to the field's type, or returns None if it does not fit
+    if value in (None, "", "null", "unknown"):
+        return None
+    try:
+        if name == "Spare Parts Replaced":
+            if isinstance(value, str):
+                value = [part.strip() for part in re.split(r"[,;]", value) if part.strip()]
+            return [str(part) for part in value]
+        if name == "Service Duration (min)":
+            minutes = parse_minutes(value)
+            return int(round(minutes)) if minutes and minutes > 0 else None
+        if name == "Technician Confidence Level (1–5)":
+            level = int(round(float(value)))
+            return level if 1 <= level <= 5 else None
+        if name == "Safety Assessment (Safe/Unsafe)":
+            value = str(value).strip().capitalize()
+            return value if value in ("Safe", "Unsafe") else None
+        if name == "Date & Time of Service":
+            if not isinstance(value, datetime):
+                value = datetime.fromisoformat(str(value).strip())
+            return value.isoformat(timespec="minutes")
+    except (TypeError, ValueError):
+        return None
+    return str(value).strip()
+
+def grounded(name, value, context):
+    # Whether a stated value actually appears in the conversation
+    if name in INFERRED_FIELDS or value is None:
+        return True
+    context = context.lower()
+    if name == "Spare Parts Replaced":
+        return all(part.lower() in context for part in value)
+    if name == "Service Duration (min)":
+        return str(value) in context or str(value / 60).rstrip("0").rstrip(".") in context
+    return str(value).lower() in context
+
+def extract_fields(names, context, reask=False):
+    # One greedy generation filling every requested field with a value and a confidence
+    fields = "\n".join(f"- {name}: {FIELD_FORMATS[name]}" for name in names)
+    instruction = (
+        ("These service report fields were unclear; read the conversation again carefully. " if reask else "") +
+        "Fill in the service report fields below from the conversation above. Use null for anything "
+        "the conversation does not establish, and rate your confidence in each value from 0 to 1.\n"
+        f"Fields:\n{fields}\n"
+        'Answer as {"<field>": {"value": ..., "confidence": ...}, ...} with exactly these field names; '
+        "for null, the confidence is how sure you are the conversation does not state it."
+    )
+    response = planning_client.post("/plan", json={
+        "context": context,
+        "instruction": instruction,
+        "response_format": "json",
+        "do_sample": False,
+        "max_new_tokens": 64 + 48 * len(names),
+        # A similar-looking earlier instruction (e.g. the first pass) is not an answer to this one
+        "cache": "exact",
+    })
+    answer = parse_json(response["plan"])
+    results = {}
+    for name in names:
+        entry = answer.get(name)
+        if not isinstance(entry, dict):
+            entry = {"value": entry, "confidence": 0.5}
+        stated = entry.get("value")
+        value = normalize_field(name, stated)
+        try:
+            confidence = min(max(float(entry.get("confidence", 0.5)), 0.0), 1.0)
+        except (TypeError, ValueError):
+            confidence = 0.5
+        if name not in answer or (value is None and stated not in (None, "", "null", "unknown")):
+            # Left out, or a value that does not fit the field
+            confidence = 0.0
+        elif value is not None and not grounded(name, value, context):
+            confidence *= 0.5
+        results[name] = (value, confidence)
+    return results
+
+def postprocess_service_report(report_dict, transcripts=(), chat_log=(), ticket=None, session_id=None):
+    # Fills report_dict from the session. Values already set and those on the ticket are kept,
+    # a missing Report ID is generated, the time of service comes from the chat log, and every
+    # other field comes out of a single extraction call. A field the model is confident the
+    # conversation does not state stays null without being asked again; only fields whose
+    # confidence falls below REPORT_CONFIDENCE_THRESHOLD are asked for again, together, at most
+    # REPORT_MAX_REASKS times. The context is the same for every call,
+    # so re-asks reuse the planning service's cached prefix.
+    report = dict(report_dict)
+    if report.get("Report ID") is None:
+        report["Report ID"] = f"RPT-{uuid.uuid4().hex[:12].upper()}"
+    confidence = {name: 1.0 for name, value in report.items() if value is not None}
+    if ticket is None and session_id:
+        ticket = get_session_ticket(session_id)
+    for name, value in ticket_fields(ticket or {}).items():
+        if report.get(name) is None:
+            report[name], confidence[name] = value, 1.0
+    if report.get("Date & Time of Service") is None:
+        started_at = service_time(chat_log, session_id)
+        if started_at is not None:
+            report["Date & Time of Service"], confidence["Date & Time of Service"] = started_at, 1.0
+
+    context = build_context(transcripts, chat_log, session_id)
+    missing = [name for name in report if name in FIELD_FORMATS and name not in confidence]
+    calls = 0
+    for attempt in range(1 + REPORT_MAX_REASKS):
+        if not missing or not context:
+            break
+        calls += 1
+        for name, (value, score) in extract_fields(missing, context, reask=attempt > 0).items():
+            if score > confidence.get(name, -1.0):
+                report[name], confidence[name] = value, score
+        missing = [name for name in missing if confidence[name] < REPORT_CONFIDENCE_THRESHOLD]
+
+    needs_review = [name for name in report if confidence.get(name, 0.0) < REPORT_CONFIDENCE_THRESHOLD]
+    return {"report": report, "confidence": confidence, "needs_review": needs_review, "model_calls": calls}
 
 def postprocess_validation():
     # User should validate final service report
@@ -0,0 +1,21 @@
+import argparse
+import time
+
+from huggingface_hub import snapshot_download
+
+# Models the agents service loads at startup (the embedding service image only needs bge)
+DEFAULT_MODELS = ["BAAI/bge-large-en-v1.5", "cross-encoder/ms-marco-MiniLM-L-6-v2"]
+
+def main():
+    # Run at image build time so containers start with HF_HUB_OFFLINE=1 and never reach the hub
+    parser = argparse.ArgumentParser(description="Download model weights into the local Hugging Face cache")
+    parser.add_argument("models", nargs="*", default=DEFAULT_MODELS)
+    args = parser.parse_args()
+
+    for model in args.models:
+        start = time.time()
+        path = snapshot_download(model)
+        print(f"[prefetch] {model} -> {path} in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
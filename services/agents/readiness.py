@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+class Readiness:
+    # Tracks a service's startup: models load and warm up on a background thread while /health
+    # already answers, and /ready reports the current phase, per-phase timings and any error.
+
+    def __init__(self, name):
+        self.name = name
+        self.state = "starting"
+        self.timings = {}
+        self.details = {}
+        self.error = None
+        self.started = time.monotonic()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @contextmanager
+    def phase(self, name):
+        self.state = name
+        start = time.monotonic()
+        yield
+        self.timings[name] = round(time.monotonic() - start, 3)
+        print(f"[{self.name}] {name} took {self.timings[name]:.2f}s")
+
+    def start(self, startup):
+        # Runs startup(self) on a background thread, then marks the service ready
+        def run():
+            try:
+                startup(self)
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                print(f"[{self.name}] startup failed: {e}")
+                raise
+            self.timings["total"] = round(time.monotonic() - self.started, 3)
+            self.state = "ready"
+            print(f"[{self.name}] ready after {self.timings['total']:.2f}s")
+        threading.Thread(target=run, daemon=True).start()
+
+    def report(self):
+        report = {"service": self.name, "ready": self.ready, "state": self.state, "timings": self.timings}
+        if self.details:
+            report.update(self.details)
+        if self.error:
+            report["error"] = self.error
+        return report, 200 if self.ready else 503
+
+def serving_process():
+    # Under `flask run --debug` the reloader's watching parent imports the app as well as the
+    # child that serves requests (WERKZEUG_RUN_MAIN=true); only the latter should load models
+    # and start background workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        return True
+    from_cli = os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+    debug = os.environ.get("FLASK_DEBUG", "").lower() not in ("", "0", "false", "no")
+    return not (from_cli and debug and "--no-reload" not in sys.argv)
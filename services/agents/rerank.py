@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+class Reranker:
+    # Re-scores retrieved chunks against the query with a cross-encoder, all candidates in one
+    # batched forward pass. Scores are cached per (query, chunk text), so only new pairs are
+    # scored. Scoring runs on a small pool of threads; if it does not finish within budget_ms
+    # the candidates keep their retrieval order, and the late scores still land in the cache.
+    # Work that waited in the queue past its request's budget is dropped unscored, so a
+    # backlog drains at once instead of timing out every request queued behind it.
+
+    def __init__(self, model_name, budget_ms=300, max_entries=4096, max_length=512, workers=2):
+        self.model_name = model_name
+        self.budget = budget_ms / 1000 if budget_ms else None
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self.model = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = {"hits": 0, "scored": 0, "fallbacks": 0, "dropped": 0}
+        # Few scoring threads: batches mostly run back to back instead of contending for the CPU
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def from_env(cls):
+        model_name = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        if not model_name:
+            return None
+        return cls(
+            model_name,
+            budget_ms=float(os.environ.get("RERANK_BUDGET_MS", 300)),
+            max_entries=int(os.environ.get("RERANK_CACHE_SIZE", 4096)),
+            workers=int(os.environ.get("RERANK_WORKERS", 2)),
+        )
+
+    def load(self):
+        if self.model is None:
+            from sentence_transformers import CrossEncoder
+
+            self.model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self.model
+
+    def warmup(self):
+        self.load().predict([("door does not close", "Check the door operator belt tension.")])
+
+    def rerank(self, query, documents, k):
+        # documents are langchain Documents in retrieval order; returns the best k
+        if len(documents) <= 1:
+            return documents[:k]
+        query = " ".join(query.split())
+        keys = [self._key(query, document.page_content) for document in documents]
+        with self.lock:
+            scores = [self.entries.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self.entries.move_to_end(key)
+            self.counts["hits"] += sum(score is not None for score in scores)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            deadline = time.monotonic() + self.budget if self.budget else None
+            future = self.executor.submit(
+                self._score, query, [(keys[i], documents[i].page_content) for i in missing], deadline
+            )
+            try:
+                result = future.result(timeout=self.budget)
+                if result is None:
+                    raise TimeoutError
+                for i, score in zip(missing, result):
+                    scores[i] = score
+            except TimeoutError:
+                with self.lock:
+                    self.counts["fallbacks"] += 1
+                return documents[:k]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order[:k]]
+
+    def stats(self):
+        with self.lock:
+            return {"model": self.model_name, "entries": len(self.entries), **self.counts}
+
+    def _key(self, query, text):
+        return hashlib.sha256(f"{query}\0{text}".encode("utf-8")).digest()
+
+    def _score(self, query, pairs, deadline=None):
+        if deadline is not None and time.monotonic() > deadline:
+            # The request already fell back to retrieval order
+            with self.lock:
+                self.counts["dropped"] += 1
+            return None
+        scores = self.load().predict([(query, text) for _, text in pairs], batch_size=len(pairs))
+        scores = [float(score) for score in scores]
+        with self.lock:
+            self.counts["scored"] += len(pairs)
+            for (key, _), score in zip(pairs, scores):
+                self.entries[key] = score
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return scores
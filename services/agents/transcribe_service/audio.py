@@ -0,0 +1,154 @@
+import io
+import subprocess
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+
+SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono float32
+
+def pcm16_to_float32(data):
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+def resample(audio, sample_rate):
+    # Polyphase resampling with an anti-aliasing low-pass, so content above 8 kHz in 44.1/48 kHz
+    # recordings is filtered out rather than folded into the speech band
+    if sample_rate == SAMPLE_RATE or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+    g = gcd(sample_rate, SAMPLE_RATE)
+    return resample_poly(audio, SAMPLE_RATE // g, sample_rate // g).astype(np.float32)
+
+class StreamResampler:
+    # resample() over a stream of chunks, with the same output as resampling the whole stream at
+    # once. Each emitted block is filtered together with `pad` input samples on either side, so
+    # chunk boundaries leave no seams; output lags input by `pad` samples until flush().
+
+    def __init__(self, sample_rate):
+        g = gcd(sample_rate, SAMPLE_RATE)
+        self.up, self.down = SAMPLE_RATE // g, sample_rate // g
+        self.passthrough = sample_rate == SAMPLE_RATE
+        # resample_poly's filter reaches 10 * max(up, down) upsampled samples either side;
+        # as a whole number of `down` input samples, block boundaries fall on output samples
+        reach = -(-10 * max(self.up, self.down) // self.up) + 1
+        self.pad = -(-reach // self.down) * self.down
+        self.buffer = np.zeros(self.pad, dtype=np.float32)
+
+    def feed(self, audio):
+        if self.passthrough:
+            return audio.astype(np.float32, copy=False)
+        self.buffer = np.concatenate([self.buffer, audio])
+        blocks = (len(self.buffer) - 2 * self.pad) // self.down
+        if blocks <= 0:
+            return np.zeros(0, dtype=np.float32)
+        skip = self.pad // self.down * self.up
+        output = resample_poly(self.buffer, self.up, self.down)[skip:skip + blocks * self.up]
+        self.buffer = self.buffer[blocks * self.down:]
+        return output.astype(np.float32)
+
+    def flush(self):
+        if self.passthrough or len(self.buffer) == self.pad:
+            return np.zeros(0, dtype=np.float32)
+        skip = self.pad // self.down * self.up
+        remaining = -(-(len(self.buffer) - self.pad) * self.up // self.down)
+        output = resample_poly(self.buffer, self.up, self.down)[skip:skip + remaining]
+        self.buffer = self.buffer[:0]
+        return output.astype(np.float32)
+
+def decode_audio(data):
+    # Decode an uploaded file in memory to 16 kHz mono float32. libsndfile covers WAV/FLAC/OGG;
+    # compressed formats it cannot read are piped through ffmpeg without touching disk.
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except RuntimeError:  # sf.LibsndfileError, format not supported
+        return decode_with_ffmpeg(data)
+    return resample(audio.mean(axis=1), sample_rate)
+
+def decode_with_ffmpeg(data):
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True)
+    if result.returncode != 0:
+        raise ValueError(f"Could not decode audio: {result.stderr.decode(errors='replace').strip()}")
+    return pcm16_to_float32(result.stdout)
+
+def read_wav_header(stream):
+    # Consume a RIFF/WAVE header from a stream, returning (sample_rate, channels, prefix)
+    # where prefix is any audio already read; falls back to raw PCM if no header is present
+    head = stream.read(12)
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None, None, head
+    sample_rate = channels = None
+    while True:
+        chunk_header = stream.read(8)
+        if len(chunk_header) < 8:
+            return sample_rate, channels, b""
+        chunk_id, size = chunk_header[:4], int.from_bytes(chunk_header[4:], "little")
+        if chunk_id == b"data":
+            return sample_rate, channels, b""
+        body = stream.read(size + (size & 1))
+        if chunk_id == b"fmt ":
+            fmt, channels, sample_rate = np.frombuffer(body[:8], dtype="<u2,<u2,<u4")[0]
+            bits = int.from_bytes(body[14:16], "little")
+            if fmt != 1 or bits != 16:
+                raise ValueError("streaming WAV must be 16-bit PCM")
+            sample_rate, channels = int(sample_rate), int(channels)
+
+class VadSegmenter:
+    # Energy-based voice activity detection over 30 ms frames. Speech is cut into segments at
+    # pauses of at least min_silence_ms, or at max_segment_s so each fits one Whisper window.
+
+    def __init__(self, threshold=0.01, min_silence_ms=500, max_segment_s=25.0, frame_ms=30, pad_ms=200):
+        self.frame = SAMPLE_RATE * frame_ms // 1000
+        self.threshold = threshold
+        self.min_silence_frames = min_silence_ms // frame_ms
+        self.max_frames = int(max_segment_s * 1000 / frame_ms)
+        self.pad_frames = pad_ms // frame_ms
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0         # samples consumed before self.buffer
+        self.frames = []        # frames of the current segment
+        self.leading = []       # recent silent frames kept as lead-in
+        self.start = None       # sample index where the current segment starts
+        self.silence = 0
+
+    def feed(self, audio):
+        self.buffer = np.concatenate([self.buffer, audio])
+        segments = []
+        n_frames = len(self.buffer) // self.frame
+        for i in range(n_frames):
+            frame = self.buffer[i * self.frame:(i + 1) * self.frame]
+            position = self.offset + i * self.frame
+            speech = np.sqrt(np.mean(frame ** 2)) >= self.threshold
+            if self.start is None:
+                if speech:
+                    self.start = position - len(self.leading) * self.frame
+                    self.frames = self.leading + [frame]
+                    self.silence = 0
+                else:
+                    self.leading = (self.leading + [frame])[-self.pad_frames:] if self.pad_frames else []
+                continue
+            self.frames.append(frame)
+            self.silence = 0 if speech else self.silence + 1
+            if self.silence >= self.min_silence_frames or len(self.frames) >= self.max_frames:
+                segments.append(self._emit())
+        consumed = n_frames * self.frame
+        self.buffer = self.buffer[consumed:]
+        self.offset += consumed
+        return segments
+
+    def flush(self):
+        if self.start is None:
+            return []
+        if len(self.buffer):
+            self.frames.append(self.buffer)
+            self.offset += len(self.buffer)
+            self.buffer = np.zeros(0, dtype=np.float32)
+        return [self._emit()]
+
+    def _emit(self):
+        audio = np.concatenate(self.frames)
+        segment = (self.start / SAMPLE_RATE, audio)
+        self.start, self.frames, self.leading, self.silence = None, [], [], 0
+        return segment
@@ -0,0 +1,115 @@
+import os
+
+# Speech recognition runtimes behind one interface. Every backend takes 16 kHz mono float32
+# arrays and returns plain text, so the service response is the same whichever is deployed.
+
+def _cuda_available():
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+class WhisperBackend:
+    # Reference openai-whisper implementation
+
+    def __init__(self, model_name):
+        import whisper
+        self.whisper = whisper
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, language=None, initial_prompt=None):
+        return self.model.transcribe(audio, language=language, initial_prompt=initial_prompt)["text"]
+
+    def transcribe_batch(self, audios, language=None):
+        # Utterances that fit one 30 s window are decoded together in a single forward pass
+        import torch
+
+        whisper = self.whisper
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        options = whisper.DecodingOptions(language=language, fp16=self.model.device.type == "cuda")
+        return [decoded.text for decoded in whisper.decode(self.model, mels, options)]
+
+class TransformersBackend:
+    # Hugging Face transformers pipeline, fp16 on GPU
+
+    def __init__(self, model_name):
+        import torch
+        from transformers import pipeline
+
+        if "/" not in model_name:
+            model_name = f"openai/whisper-{model_name}"
+        cuda = _cuda_available()
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model_name,
+            torch_dtype=torch.float16 if cuda else torch.float32,
+            device=0 if cuda else -1,
+        )
+
+    def _generate_kwargs(self, language=None, initial_prompt=None):
+        kwargs = {}
+        if language:
+            kwargs["language"] = language
+        if initial_prompt:
+            kwargs["prompt_ids"] = self.pipe.tokenizer.get_prompt_ids(initial_prompt, return_tensors="pt")
+        return kwargs
+
+    def transcribe(self, audio, language=None, initial_prompt=None):
+        result = self.pipe(
+            {"raw": audio, "sampling_rate": 16000},
+            chunk_length_s=30,
+            generate_kwargs=self._generate_kwargs(language, initial_prompt),
+        )
+        return result["text"]
+
+    def transcribe_batch(self, audios, language=None):
+        results = self.pipe(
+            [{"raw": audio, "sampling_rate": 16000} for audio in audios],
+            batch_size=len(audios),
+            generate_kwargs=self._generate_kwargs(language),
+        )
+        return [result["text"] for result in results]
+
+class CTranslate2Backend:
+    # faster-whisper on CTranslate2, int8 weights by default for CPU-only nodes
+
+    def __init__(self, model_name):
+        from faster_whisper import WhisperModel
+
+        device = os.environ.get("ASR_DEVICE") or ("cuda" if _cuda_available() else "cpu")
+        compute_type = os.environ.get("ASR_COMPUTE_TYPE") or ("int8_float16" if device == "cuda" else "int8")
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type)
+
+    def transcribe(self, audio, language=None, initial_prompt=None):
+        segments, _ = self.model.transcribe(audio, language=language, initial_prompt=initial_prompt)
+        return "".join(segment.text for segment in segments)
+
+    def transcribe_batch(self, audios, language=None):
+        return [self.transcribe(audio, language=language) for audio in audios]
+
+BACKENDS = {
+    "whisper": WhisperBackend,
+    "transformers": TransformersBackend,
+    "ctranslate2": CTranslate2Backend,
+}
+# pip package each backend imports
+BACKEND_PACKAGES = {
+    "whisper": "openai-whisper",
+    "transformers": "transformers",
+    "ctranslate2": "faster-whisper",
+}
+
+def load_backend(name, model_name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    try:
+        return BACKENDS[name](model_name)
+    except ImportError as e:
+        raise ImportError(
+            f"ASR_BACKEND={name} needs the {BACKEND_PACKAGES[name]} package (missing module {e.name}); "
+            f"build the image with ASR_EXTRAS={name} or install transcribe_service/requirements-{name}.txt"
+        ) from e
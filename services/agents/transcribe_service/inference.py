@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+# Keep this module free of import-time side effects: pool workers are spawned and import it.
+
+MAX_BATCH_SAMPLES = 30 * 16000  # one Whisper window
+
+_backend = None
+_load_seconds = None
+
+def _init_worker(backend_name, model_name, threads):
+    global _backend, _load_seconds
+    start = time.monotonic()
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from backends import load_backend
+
+    _backend = load_backend(backend_name, model_name)
+    _load_seconds = round(time.monotonic() - start, 3)
+
+def _warmup():
+    # One plain and one batched decode of a second of silence, to get first-call costs
+    # out of the way before real requests arrive
+    import numpy as np
+
+    audio = np.zeros(16000, dtype=np.float32)
+    start = time.monotonic()
+    _backend.transcribe(audio)
+    _backend.transcribe_batch([audio, audio])
+    return {"pid": os.getpid(), "load_s": _load_seconds, "warmup_s": round(time.monotonic() - start, 3)}
+
+def _run_batch(items, language=None):
+    # Utterances that fit one 30 s window and need no prompt are decoded as one batch;
+    # anything longer goes through the backend's sliding-window transcribe.
+    results = [None] * len(items)
+    short = [i for i, (audio, options) in enumerate(items)
+             if not options and len(audio) <= MAX_BATCH_SAMPLES]
+    if len(short) > 1:
+        texts = _backend.transcribe_batch([items[i][0] for i in short], language=language)
+        for i, text in zip(short, texts):
+            results[i] = {"text": text}
+    for i, (audio, options) in enumerate(items):
+        if results[i] is None:
+            results[i] = {"text": _backend.transcribe(audio, language=language, **options)}
+    return results
+
+class QueueFull(Exception):
+    pass
+
+class InferenceScheduler:
+    # Feeds a bounded request queue into a pool of model replicas. A batch is formed only when a
+    # replica is free, so under load requests naturally coalesce into larger batches.
+
+    def __init__(self, model_name, backend="whisper", workers=1, max_queue=64, max_batch_size=8,
+                 max_wait_ms=20, language=None):
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend, model_name, threads),
+        )
+        self.workers = workers
+        self.pending = queue.Queue(maxsize=max_queue)
+        self.slots = threading.Semaphore(workers)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.language = language
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get("WHISPER_MODEL", "base"),
+            backend=os.environ.get("ASR_BACKEND", "whisper"),
+            workers=int(os.environ.get("TRANSCRIBE_WORKERS", 1)),
+            max_queue=int(os.environ.get("TRANSCRIBE_QUEUE_SIZE", 64)),
+            max_batch_size=int(os.environ.get("TRANSCRIBE_MAX_BATCH", 8)),
+            max_wait_ms=float(os.environ.get("TRANSCRIBE_MAX_WAIT_MS", 20)),
+            language=os.environ.get("WHISPER_LANGUAGE") or None,
+        )
+
+    def submit(self, audio, block=False, **options):
+        future = Future()
+        try:
+            self.pending.put((audio, options, future), block=block)
+        except queue.Full:
+            raise QueueFull(f"{self.pending.maxsize} transcriptions already queued")
+        return future
+
+    def warmup(self):
+        # Submitted together so each replica starts and warms up in parallel
+        futures = [self.pool.submit(_warmup) for _ in range(self.workers)]
+        return [future.result() for future in futures]
+
+    def depth(self):
+        return self.pending.qsize()
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            self.slots.acquire()
+            batch = self._collect()
+            try:
+                future = self.pool.submit(
+                    _run_batch, [(audio, options) for audio, options, _ in batch], self.language
+                )
+            except Exception as e:
+                self._complete(batch, None, error=e)
+                continue
+            future.add_done_callback(partial(self._complete, batch))
+
+    def _complete(self, batch, future, error=None):
+        self.slots.release()
+        try:
+            results = future.result() if error is None else None
+        except Exception as e:
+            error = e
+        for i, (_, _, item_future) in enumerate(batch):
+            if error is not None:
+                item_future.set_exception(error)
+            else:
+                item_future.set_result(results[i])
@@ -1,19 +1,112 @@
-from flask import Flask, request, jsonify
-import whisper
-import tempfile
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
+import os
+import time
+
+from audio import StreamResampler, VadSegmenter, decode_audio, pcm16_to_float32, read_wav_header
+from inference import InferenceScheduler, QueueFull
+from readiness import Readiness
 
 app = Flask(__name__)
-model = whisper.load_model("base")
+readiness = Readiness("transcribe_service")
+scheduler = None
+
+STREAM_READ_BYTES = 32000  # ~1 s of 16 kHz 16-bit audio
+
+def startup(readiness):
+    global scheduler
+    with readiness.phase("load_and_warmup"):
+        scheduler = InferenceScheduler.from_env()
+        readiness.details["workers"] = scheduler.warmup()
+    readiness.details["backend"] = os.environ.get("ASR_BACKEND", "whisper")
+    readiness.details["model"] = os.environ.get("WHISPER_MODEL", "base")
+
+def not_ready():
+    return jsonify({"error": "Model is still loading"}), 503, {"Retry-After": "5"}
+
+@app.route("/health", methods=["GET"])
+def health_check():
+    return jsonify({"status": "ok", "time": time.time()})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    report, status = readiness.report()
+    return jsonify(report), status
 
 @app.route("/transcribe", methods=["POST"])
 def transcribe():
+    if not readiness.ready:
+        return not_ready()
     if "file" not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
     file = request.files["file"]
-    with tempfile.NamedTemporaryFile(delete=True) as tmp:
-        file.save(tmp.name)
-        result = model.transcribe(tmp.name)
+    try:
+        audio = decode_audio(file.read())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = scheduler.submit(audio).result()
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
     return jsonify({"text": result["text"]})
 
+@app.route("/transcribe/stream", methods=["POST"])
+def transcribe_stream():
+    # Body is a (chunked) upload of a 16-bit PCM WAV, or of raw 16-bit mono PCM at
+    # ?sample_rate=. Each speech segment is transcribed as soon as VAD closes it and
+    # returned as one JSON line, followed by a final line with the full text.
+    if not readiness.ready:
+        return not_ready()
+    if scheduler.pending.full():
+        return jsonify({"error": "Transcription queue is full"}), 429, {"Retry-After": "1"}
+    stream = request.stream
+    try:
+        sample_rate, channels, pending = read_wav_header(stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    sample_rate = sample_rate or request.args.get("sample_rate", 16000, type=int)
+    channels = channels or 1
+    frame_bytes = 2 * channels
+
+    def transcribe_segments(segments, texts):
+        for start, audio in segments:
+            # Condition on the tail of what was said so far. A stream that has started is
+            # allowed to wait for queue space rather than fail halfway through.
+            prompt = " ".join(texts)[-200:]
+            options = {"initial_prompt": prompt} if prompt else {}
+            result = scheduler.submit(audio, block=True, **options).result()
+            text = result["text"].strip()
+            texts.append(text)
+            yield json.dumps({
+                "segment": len(texts) - 1,
+                "start": round(start, 2),
+                "end": round(start + len(audio) / 16000, 2),
+                "text": text,
+            }) + "\n"
+
+    def generate(pending):
+        segmenter = VadSegmenter()
+        resampler = StreamResampler(sample_rate)
+        texts = []
+        while True:
+            data = stream.read(STREAM_READ_BYTES)
+            pending += data
+            usable = len(pending) - len(pending) % frame_bytes
+            if usable:
+                audio = pcm16_to_float32(pending[:usable])
+                if channels > 1:
+                    audio = audio.reshape(-1, channels).mean(axis=1)
+                pending = pending[usable:]
+                yield from transcribe_segments(segmenter.feed(resampler.feed(audio)), texts)
+            if not data:
+                break
+        yield from transcribe_segments(segmenter.feed(resampler.flush()), texts)
+        yield from transcribe_segments(segmenter.flush(), texts)
+        yield json.dumps({"text": " ".join(texts), "final": True}) + "\n"
+
+    return Response(stream_with_context(generate(pending)), mimetype="application/x-ndjson")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8001)
+    # Started under the main guard: the pool's spawned workers re-import this module
+    readiness.start(startup)
+    app.run(host="0.0.0.0", port=8001, threaded=True)
@@ -0,0 +1,103 @@
+import os
+import threading
+
+from lexical import get_lexical_index, reciprocal_rank_fusion
+
+# Open Chroma collections, keyed by persist directory
+_stores = {}
+_lock = threading.Lock()
+
+def index_version(save_path):
+    # Chroma rewrites its sqlite file on every ingest, so its mtime tracks the index version
+    try:
+        return os.stat(os.path.join(save_path, "chroma.sqlite3")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def get_vector_store(save_path, embedding_function, backend="chroma"):
+    # backend "compact" searches the quantized export built by compact_store.py instead of
+    # Chroma, when the store has one
+    from compact_store import compact_version
+
+    if backend == "compact" and compact_version(save_path) is not None:
+        return _get_compact_store(save_path, embedding_function)
+
+    # chromadb and langchain_chroma are slow to import, load them on first use
+    from chromadb.api.shared_system_client import SharedSystemClient
+    from langchain_chroma import Chroma
+
+    version = index_version(save_path)
+    entry = _stores.get(save_path)
+    if entry is not None and entry[1] == version:
+        return entry[0]
+    with _lock:
+        entry = _stores.get(save_path)
+        if entry is None or entry[1] != version:
+            if entry is not None:
+                # chromadb shares one system per path, drop it so the new handle rereads the files
+                SharedSystemClient.clear_system_cache()
+            store = Chroma(
+                persist_directory=save_path,
+                embedding_function=embedding_function
+            )
+            entry = (store, version)
+            _stores[save_path] = entry
+    return entry[0]
+
+def _get_compact_store(save_path, embedding_function):
+    from compact_store import CompactVectorStore, compact_version
+
+    key = (save_path, "compact")
+    version = compact_version(save_path)
+    entry = _stores.get(key)
+    if entry is not None and entry[1] == version:
+        return entry[0]
+    with _lock:
+        entry = _stores.get(key)
+        if entry is None or entry[1] != version:
+            entry = (CompactVectorStore(save_path, embedding_function), version)
+            _stores[key] = entry
+    return entry[0]
+
+def build_filter(manual=None, equipment=None, pages=None):
+    # Chroma where clause for chunk metadata written by ingest.py. manual and equipment take a
+    # value or a list of values, pages a (first, last) range where either end may be None.
+    clauses = []
+    for key, values in (("manual", manual), ("equipment", equipment)):
+        if values:
+            values = [values] if isinstance(values, str) else list(values)
+            clauses.append({key: values[0]} if len(values) == 1 else {key: {"$in": values}})
+    if pages:
+        first, last = pages
+        if first is not None:
+            clauses.append({"page": {"$gte": first}})
+        if last is not None:
+            clauses.append({"page": {"$lte": last}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def hybrid_search(vector_store, save_path, query, k=3, dense_k=6, lexical_k=6,
+                  dense_weight=1.0, lexical_weight=1.0, manual=None, equipment=None, pages=None):
+    # Fuses the dense ranking with the BM25 ranking by reciprocal rank fusion, so exact
+    # part numbers and fault codes surface even when the embedding ranks them low.
+    # Both rankings apply the same metadata filters before fusion.
+    from langchain_core.documents import Document
+
+    dense = vector_store.similarity_search(
+        query, k=dense_k, filter=build_filter(manual, equipment, pages)
+    )
+    lexical = get_lexical_index(save_path).search(
+        query, k=lexical_k, manual=manual, equipment=equipment, pages=pages
+    )
+    docs = {doc.id: doc for doc in dense}
+    fused = reciprocal_rank_fusion(
+        [[doc.id for doc in dense], [doc_id for doc_id, _ in lexical]],
+        [dense_weight, lexical_weight]
+    )[:k]
+    missing = [doc_id for doc_id in fused if doc_id not in docs]
+    if missing:
+        found = vector_store.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+            docs[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata)
+    return [docs[doc_id] for doc_id in fused if doc_id in docs]
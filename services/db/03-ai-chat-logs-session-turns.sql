@@ -0,0 +1,3 @@
+-- Session transcripts are read in id order, a page at a time (WHERE session_id = ? AND id > ?),
+-- which this index answers with a single range scan
+CREATE INDEX IF NOT EXISTS idx_ai_chat_logs_session_id_id ON ai_chat_logs(session_id, id);